@@ -2,26 +2,41 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from .forms import UserProfileAdminForm
 from .models import UserProfile, PointsHistory
+from .referrals import set_referrer, top_referrers, top_referrers_by_revenue, referral_levels
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
+    form = UserProfileAdminForm
+    # UserProfile also points at User through referred_by
+    fk_name = 'user'
     can_delete = False
     verbose_name_plural = 'Profile'
     readonly_fields = ['member_number', 'referral_code', 'created_at']
+    raw_id_fields = ['referred_by']
 
 class CustomUserAdmin(UserAdmin):
     inlines = (UserProfileInline,)
     list_display = ('username', 'email', 'first_name', 'last_name', 'get_member_number', 'get_points', 'is_staff')
+    list_select_related = ['userprofile']
     list_filter = UserAdmin.list_filter + ('userprofile__created_at',)
     
     def get_member_number(self, obj):
         return obj.userprofile.member_number
     get_member_number.short_description = 'Member #'
+    get_member_number.admin_order_field = 'userprofile__member_number'
     
     def get_points(self, obj):
         return obj.userprofile.points
     get_points.short_description = 'Points'
+    get_points.admin_order_field = 'userprofile__points'
+    
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        for inline_form in formset.forms:
+            if isinstance(inline_form.instance, UserProfile) and 'referred_by' in inline_form.changed_data:
+                set_referrer(inline_form.instance.user_id, inline_form.instance.referred_by_id)
 
 # Unregister the default User admin and register the custom one
 admin.site.unregister(User)
@@ -29,10 +44,14 @@ admin.site.register(User, CustomUserAdmin)
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
+    form = UserProfileAdminForm
     list_display = ['user', 'member_number', 'points', 'phone_number', 'referred_by', 'created_at']
+    # referred_by is nullable, so the automatic select_related() skips it
+    list_select_related = ['user', 'referred_by']
     list_filter = ['created_at', 'referred_by']
     search_fields = ['user__username', 'user__email', 'member_number', 'phone_number']
     readonly_fields = ['member_number', 'referral_code', 'created_at']
+    raw_id_fields = ['user', 'referred_by']
     
     fieldsets = (
         ('User Information', {
@@ -45,10 +64,16 @@ class UserProfileAdmin(admin.ModelAdmin):
             'fields': ('points', 'referred_by')
         }),
     )
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'referred_by' in form.changed_data:
+            set_referrer(obj.user_id, obj.referred_by_id)
 
 @admin.register(PointsHistory)
 class PointsHistoryAdmin(admin.ModelAdmin):
     list_display = ['user', 'transaction_type', 'points', 'description', 'created_at']
+    list_select_related = ['user']
     list_filter = ['transaction_type', 'created_at']
     search_fields = ['user__username', 'description']
     readonly_fields = ['created_at']
@@ -63,14 +88,20 @@ admin.site.site_title = "Fresh Market"
 admin.site.index_title = "Welcome to Fresh Market Administration"
 
 # Add custom admin dashboard views
-from django.shortcuts import render
+from django.contrib import messages
+from django.shortcuts import render, redirect
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import path
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from store.models import Product, ProductOption, Order, DailySalesRollup
+from store.middleware import query_stats
+from store.routers import use_replica
 
 @staff_member_required
+@use_replica
 def admin_dashboard(request):
     """Custom admin dashboard with statistics"""
     
@@ -82,30 +113,29 @@ def admin_dashboard(request):
     # Basic statistics
     total_products = Product.objects.filter(is_active=True).count()
     total_users = User.objects.count()
-    total_orders = Order.objects.count()
-    pending_orders = Order.objects.filter(status='pending').count()
-    
-    # Revenue statistics
-    total_revenue = Order.objects.exclude(status='cancelled').aggregate(
-        total=Sum('total_amount'))['total'] or 0
-    
-    weekly_revenue = Order.objects.filter(
-        created_at__gte=week_ago,
-        status__in=['processing', 'shipped', 'delivered']
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
     
-    monthly_revenue = Order.objects.filter(
-        created_at__gte=month_ago,
-        status__in=['processing', 'shipped', 'delivered']
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
+    # Order and revenue statistics come from the daily rollups in one query
+    paid_statuses = ['processing', 'shipped', 'delivered']
+    sales = DailySalesRollup.objects.aggregate(
+        total_orders=Sum('order_count'),
+        pending_orders=Sum('order_count', filter=Q(status='pending')),
+        total_revenue=Sum('revenue', filter=~Q(status='cancelled')),
+        weekly_revenue=Sum('revenue', filter=Q(date__gte=week_ago, status__in=paid_statuses)),
+        monthly_revenue=Sum('revenue', filter=Q(date__gte=month_ago, status__in=paid_statuses)),
+    )
+    total_orders = sales['total_orders'] or 0
+    pending_orders = sales['pending_orders'] or 0
+    total_revenue = sales['total_revenue'] or 0
+    weekly_revenue = sales['weekly_revenue'] or 0
+    monthly_revenue = sales['monthly_revenue'] or 0
     
     # Product statistics
     low_stock_products = ProductOption.objects.filter(stock_quantity__lt=10)
     
     # Popular products (based on order frequency)
     popular_products = Product.objects.annotate(
-        order_count=Count('options__orderitem')
-    ).order_by('-order_count')[:5]
+        order_count=Sum('daily_sales__order_lines')
+    ).filter(order_count__gt=0).order_by('-order_count')[:5]
     
     # Recent orders
     recent_orders = Order.objects.order_by('-created_at')[:10]
@@ -125,6 +155,47 @@ def admin_dashboard(request):
     
     return render(request, 'admin/dashboard.html', context)
 
+@staff_member_required
+def query_stats_view(request):
+    """Hottest views by database time, from QueryStatsMiddleware"""
+    if request.method == 'POST':
+        query_stats.reset()
+        return redirect('admin:query_stats')
+    
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Query statistics',
+        'views': query_stats.hottest(),
+        'started_at': datetime.fromtimestamp(query_stats.started_at, tz=dt_timezone.utc),
+        'sample_rate': getattr(settings, 'QUERY_STATS_SAMPLE_RATE', 0.1),
+    }
+    return render(request, 'admin/query_stats.html', context)
+
+@staff_member_required
+@use_replica
+def referral_stats_view(request):
+    """Top referrers by downstream members and revenue, from ReferralClosure"""
+    member = None
+    levels = []
+    username = request.GET.get('member', '').strip()
+    if username:
+        member = User.objects.filter(username=username).first()
+        if member is None:
+            messages.warning(request, f'No user named {username}')
+        else:
+            levels = referral_levels(member.pk)
+    
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Referrals',
+        'top_referrers': top_referrers(),
+        'top_by_revenue': top_referrers_by_revenue(),
+        'username': username,
+        'member': member,
+        'levels': levels,
+    }
+    return render(request, 'admin/referral_stats.html', context)
+
 # Add custom URLs to admin
 from django.contrib import admin
 from django.urls import path
@@ -134,6 +205,8 @@ class CustomAdminSite(admin.AdminSite):
         urls = super().get_urls()
         custom_urls = [
             path('dashboard/', admin_dashboard, name='admin_dashboard'),
+            path('query-stats/', query_stats_view, name='query_stats'),
+            path('referrals/', referral_stats_view, name='referral_stats'),
         ]
         return custom_urls + urls
 
@@ -0,0 +1,134 @@
+# accounts/codes.py
+# Member numbers and referral codes. Unique codes are generated ahead of time
+# in bulk and stored in CodePool at consecutive positions per kind. Claiming
+# one takes the next position from a BlockAllocator, so concurrent
+# registrations never race for the same random code, and costs one indexed
+# lookup. That lookup also checks that the pool has codes further ahead and
+# queues a background refill when it is running low. If the pool has run dry
+# a code is drawn at random and checked against the existing ones instead.
+import random
+import string
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from .models import UserProfile, CodePool
+from store.models import NumberSequence
+from store.sequences import BlockAllocator
+from store.tasks import run_in_background
+
+ALPHABET = string.ascii_uppercase + string.digits
+# Code length per kind; kinds are also the UserProfile field names
+LENGTHS = {'member_number': 8, 'referral_code': 6}
+# Free codes a refill tops each pool up to
+REFILL_SIZE = getattr(settings, 'CODE_POOL_REFILL_SIZE', 10000)
+# A refill is queued once fewer than this many codes are left
+LOW_WATER = REFILL_SIZE // 5
+
+_claims = {
+    kind: BlockAllocator(f'{kind}_pool', getattr(settings, 'CODE_POOL_BLOCK_SIZE', 20))
+    for kind in LENGTHS
+}
+_refilling = set()
+_refilling_lock = threading.Lock()
+
+
+def claim_code(kind):
+    """A unique, unused code of ``kind`` for a new member"""
+    position = _claims[kind].allocate()
+    found = dict(CodePool.objects.filter(
+        kind=kind, position__in=[position, position + LOW_WATER]
+    ).values_list('position', 'code'))
+    if position + LOW_WATER not in found:
+        _schedule_refill(kind)
+    return found.get(position) or random_codes(kind, 1)[0]
+
+
+def claim_codes(kind, count):
+    """``count`` unique codes of ``kind`` for bulk-created members"""
+    positions = _claims[kind].allocate_range(count)
+    if not positions:
+        return []
+    found = dict(CodePool.objects.filter(
+        kind=kind, position__gte=positions.start, position__lt=positions.stop + LOW_WATER
+    ).values_list('position', 'code'))
+    if positions.stop - 1 + LOW_WATER not in found:
+        _schedule_refill(kind)
+    spare = iter(random_codes(kind, sum(1 for position in positions if position not in found)))
+    return [found.get(position) or next(spare) for position in positions]
+
+
+def assign_codes(profiles):
+    """Fill in missing member numbers and referral codes on unsaved profiles"""
+    for kind in LENGTHS:
+        missing = [profile for profile in profiles if not getattr(profile, kind)]
+        for profile, code in zip(missing, claim_codes(kind, len(missing))):
+            setattr(profile, kind, code)
+    return profiles
+
+
+def random_codes(kind, count, chunk_size=500):
+    """``count`` distinct random codes not yet used by a member or the pool"""
+    codes = []
+    while len(codes) < count:
+        candidates = list(
+            {''.join(random.choices(ALPHABET, k=LENGTHS[kind])) for n in range(count - len(codes))} - set(codes)
+        )
+        for start in range(0, len(candidates), chunk_size):
+            chunk = candidates[start:start + chunk_size]
+            taken = set(UserProfile.objects.filter(**{f'{kind}__in': chunk}).values_list(kind, flat=True))
+            taken.update(CodePool.objects.filter(kind=kind, code__in=chunk).values_list('code', flat=True))
+            codes.extend(code for code in chunk if code not in taken)
+    return codes
+
+
+def pool_status(kind):
+    """``(next position to claim, last position filled)``"""
+    claimed = NumberSequence.objects.filter(name=_claims[kind].name).values_list('next_value', flat=True).first() or 1
+    last = CodePool.objects.filter(kind=kind).aggregate(last=Max('position'))['last'] or 0
+    return claimed, last
+
+
+def refill_pool(kind, target=REFILL_SIZE, prune=False):
+    """Top the pool of ``kind`` up to ``target`` unclaimed codes; returns how many were added"""
+    claimed, last = pool_status(kind)
+    if prune:
+        # Claimed codes belong to members now. Positions reserved by a
+        # process but not yet used fall back to random codes if removed.
+        CodePool.objects.filter(kind=kind, position__lt=claimed).delete()
+    free = max(last - claimed + 1, 0)
+    if free >= target:
+        return 0
+
+    # Positions already passed by claims would never be handed out
+    start = max(claimed, last + 1)
+    codes = random_codes(kind, target - free)
+    try:
+        with transaction.atomic():
+            CodePool.objects.bulk_create([
+                CodePool(kind=kind, position=start + offset, code=code)
+                for offset, code in enumerate(codes)
+            ], batch_size=1000)
+    except IntegrityError:
+        # Another refill filled these positions first
+        return 0
+    return len(codes)
+
+
+def _schedule_refill(kind):
+    with _refilling_lock:
+        if kind in _refilling:
+            return
+        _refilling.add(kind)
+    # Not tied to the caller's transaction: the pool is needed either way
+    run_in_background(_refill_in_background, kind)
+
+
+def _refill_in_background(kind):
+    try:
+        refill_pool(kind)
+    finally:
+        with _refilling_lock:
+            _refilling.discard(kind)
@@ -3,6 +3,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from .models import UserProfile, ReferralClosure
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -29,3 +30,16 @@ class UserRegistrationForm(UserCreationForm):
             user.userprofile.save()
         
         return user
+
+class UserProfileAdminForm(forms.ModelForm):
+    class Meta:
+        model = UserProfile
+        fields = '__all__'
+    
+    def clean_referred_by(self):
+        referrer = self.cleaned_data.get('referred_by')
+        user_id = self.instance.user_id
+        if referrer is not None and user_id is not None:
+            if referrer.pk == user_id or ReferralClosure.objects.filter(ancestor_id=user_id, descendant=referrer).exists():
+                raise forms.ValidationError('This user was referred, directly or through others, by this member.')
+        return referrer
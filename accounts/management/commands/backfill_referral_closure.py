@@ -0,0 +1,30 @@
+# Rebuild the referral closure table from UserProfile.referred_by. Needed
+# once for members who joined before the table existed, and after bulk
+# imports that set referred_by directly. Run it during a quiet period:
+# referrals made mid-run are lost until the next run.
+# Usage: python manage.py backfill_referral_closure [--chunk-size 5000]
+
+import time
+
+from django.core.management.base import BaseCommand
+from accounts.referrals import rebuild_closure
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ReferralClosure from referred_by'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows, cycles = rebuild_closure(options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        for user_id in cycles[:20]:
+            self.stdout.write(self.style.WARNING(f'user {user_id}: referral chain loops back on itself'))
+        summary = f'{rows} referral links written in {elapsed:.1f}s'
+        if cycles:
+            self.stdout.write(self.style.WARNING(f'{summary}, {len(cycles)} members in referral loops'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
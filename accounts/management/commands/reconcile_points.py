@@ -0,0 +1,81 @@
+# Verify every member's cached points balance against the points ledger.
+# The ledger is streamed in user order, so memory stays flat however long the
+# history is. Run it during a quiet period: balances that change mid-run can
+# show up as mismatches.
+# Usage: python manage.py reconcile_points [--repair] [--checkpoint]
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from accounts.models import UserProfile, PointsHistory, PointsCheckpoint
+from accounts.points import stream_balances
+
+
+class Command(BaseCommand):
+    help = 'Reconcile UserProfile.points with PointsHistory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--repair', action='store_true', help='Set mismatched balances to the ledger balance')
+        parser.add_argument('--checkpoint', action='store_true', help='Write a fresh balance checkpoint per user')
+        parser.add_argument('--show', type=int, default=20, help='Mismatches to print')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+        run_started = timezone.now()
+        checked = mismatched = 0
+        repairs = []
+        checkpoints = []
+
+        # One transaction so both streams read the same snapshot
+        with transaction.atomic():
+            up_to = PointsHistory.objects.order_by('-id').values_list('id', flat=True).first()
+            balances = stream_balances(chunk_size, up_to)
+            pending = next(balances, None)
+            profiles = UserProfile.objects.order_by('user_id').values_list('user_id', 'points')
+
+            for user_id, points in profiles.iterator(chunk_size=chunk_size):
+                while pending is not None and pending[0] < user_id:
+                    pending = next(balances, None)
+                ledger = 0
+                if pending is not None and pending[0] == user_id:
+                    ledger, last_entry_id = pending[1], pending[2]
+                    pending = next(balances, None)
+                    if options['checkpoint']:
+                        checkpoints.append(PointsCheckpoint(user_id=user_id, balance=ledger, last_entry_id=last_entry_id))
+                        if len(checkpoints) >= chunk_size:
+                            PointsCheckpoint.objects.bulk_create(checkpoints)
+                            checkpoints = []
+
+                checked += 1
+                if ledger != points:
+                    mismatched += 1
+                    if mismatched <= options['show']:
+                        self.stdout.write(f'user {user_id}: balance {points}, ledger {ledger}')
+                    if options['repair']:
+                        repairs.append((user_id, ledger - points))
+
+                if checked % (chunk_size * 10) == 0:
+                    self.stdout.write(f'{checked} members checked')
+
+            if checkpoints:
+                PointsCheckpoint.objects.bulk_create(checkpoints)
+            if options['checkpoint']:
+                PointsCheckpoint.objects.filter(created_at__lt=run_started).delete()
+
+        for user_id, delta in repairs:
+            # Adjust by the difference so changes made since the scan survive
+            UserProfile.objects.filter(user_id=user_id).update(points=F('points') + delta)
+
+        elapsed = time.perf_counter() - started
+        summary = f'{checked} members checked in {elapsed:.1f}s, {mismatched} mismatches'
+        if repairs:
+            summary += f', {len(repairs)} repaired'
+        if mismatched and not repairs:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,28 @@
+# Top up the pools of pre-generated member numbers and referral codes. Run it
+# on a schedule (e.g. hourly from cron) so registrations never find the pool
+# empty; claims also queue a refill in the background when it runs low.
+# Usage: python manage.py refill_code_pool [--size 10000] [--prune]
+
+import time
+
+from django.core.management.base import BaseCommand
+from accounts.codes import LENGTHS, REFILL_SIZE, pool_status, refill_pool
+
+
+class Command(BaseCommand):
+    help = 'Refill the member number and referral code pools'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=REFILL_SIZE, help='Unclaimed codes to keep per pool')
+        parser.add_argument('--prune', action='store_true', help='Delete codes that have been claimed')
+
+    def handle(self, *args, **options):
+        for kind in LENGTHS:
+            started = time.perf_counter()
+            added = refill_pool(kind, options['size'], prune=options['prune'])
+            claimed, last = pool_status(kind)
+            self.stdout.write(
+                f'{kind}: {added} codes added in {time.perf_counter() - started:.1f}s, '
+                f'{max(last - claimed + 1, 0)} unclaimed'
+            )
+        self.stdout.write(self.style.SUCCESS('Code pools refilled'))
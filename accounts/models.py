@@ -2,7 +2,7 @@
 ```python
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
 class UserProfile(models.Model):
@@ -19,14 +19,12 @@ class UserProfile(models.Model):
         return f"{self.user.username} - {self.member_number}"
     
     def save(self, *args, **kwargs):
-        if not self.member_number:
-            import random
-            import string
-            self.member_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-        if not self.referral_code:
-            import random
-            import string
-            self.referral_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        if not self.member_number or not self.referral_code:
+            from .codes import claim_code
+            if not self.member_number:
+                self.member_number = claim_code('member_number')
+            if not self.referral_code:
+                self.referral_code = claim_code('referral_code')
         super().save(*args, **kwargs)
 
 @receiver(post_save, sender=User)
@@ -45,11 +43,71 @@ class PointsHistory(models.Model):
         ('referral', 'Referral Bonus'),
     ]
     
+    # Transaction types that take points away from the balance
+    DEBIT_TYPES = ('redeemed',)
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     points = models.IntegerField()
     description = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [models.Index(fields=['user', 'id'])]
+    
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - {self.points} points"
+
+class PointsCheckpoint(models.Model):
+    # Ledger balance of a user after all PointsHistory entries up to and
+    # including last_entry_id
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='points_checkpoints')
+    balance = models.IntegerField()
+    last_entry_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['user', '-last_entry_id'])]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.balance} points @ {self.last_entry_id}"
+
+class CodePool(models.Model):
+    # Pre-generated unique member numbers and referral codes, handed out in
+    # position order by accounts.codes
+    KIND_CHOICES = [
+        ('member_number', 'Member number'),
+        ('referral_code', 'Referral code'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    position = models.BigIntegerField()
+    code = models.CharField(max_length=20)
+    
+    class Meta:
+        unique_together = [('kind', 'position'), ('kind', 'code')]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.position}: {self.code}"
+
+class ReferralClosure(models.Model):
+    # One row per member and each of their referrers up the referred_by
+    # chain; depth 1 is the direct referrer. Maintained by accounts.referrals
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='referral_descendants')
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='referral_ancestors')
+    depth = models.PositiveIntegerField()
+    
+    class Meta:
+        unique_together = [('ancestor', 'descendant')]
+        # Per-referrer totals by level read this index alone
+        indexes = [models.Index(fields=['ancestor', 'depth'])]
+    
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+@receiver(pre_delete, sender=User)
+def detach_referral_subtree(sender, instance, **kwargs):
+    # Members referred by a deleted user lose their referrer (SET_NULL), so
+    # the deleted user's referrers stop being their ancestors
+    from .referrals import detach_member
+    detach_member(instance.pk)
@@ -0,0 +1,66 @@
+# accounts/points.py
+# Points ledger. PointsHistory rows are the ledger entries (redemptions count
+# negative) and UserProfile.points is a cached balance kept in step with
+# F() updates. PointsCheckpoint rows let a balance be recomputed from the
+# last checkpoint plus the entries after it instead of the whole history.
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+
+from .models import UserProfile, PointsHistory, PointsCheckpoint
+
+SIGNED_POINTS = Case(
+    When(transaction_type__in=PointsHistory.DEBIT_TYPES, then=-F('points')),
+    default=F('points'),
+)
+
+
+def signed_points(transaction_type, points):
+    """``points`` as they count towards the balance; SIGNED_POINTS in SQL"""
+    return -points if transaction_type in PointsHistory.DEBIT_TYPES else points
+
+
+def add_points(user, transaction_type, points, description):
+    """Record a ledger entry and apply it to the user's balance"""
+    with transaction.atomic():
+        entry = PointsHistory.objects.create(
+            user=user,
+            transaction_type=transaction_type,
+            points=points,
+            description=description
+        )
+        UserProfile.objects.filter(user=user).update(points=F('points') + signed_points(transaction_type, points))
+    return entry
+
+
+def ledger_balance(user):
+    """Balance according to the ledger: last checkpoint plus the tail after it"""
+    checkpoint = PointsCheckpoint.objects.filter(user=user).order_by('-last_entry_id').first()
+    entries = PointsHistory.objects.filter(user=user)
+    balance = 0
+    if checkpoint is not None:
+        entries = entries.filter(id__gt=checkpoint.last_entry_id)
+        balance = checkpoint.balance
+    return balance + (entries.aggregate(total=Sum(SIGNED_POINTS))['total'] or 0)
+
+
+def stream_balances(chunk_size=5000, up_to=None):
+    """Yield ``(user_id, balance, last_entry_id)`` for every user with entries.
+
+    Reads the ledger in user order as a stream, so memory use does not depend
+    on the size of the history.
+    """
+    entries = PointsHistory.objects.order_by('user_id', 'id')
+    if up_to is not None:
+        entries = entries.filter(id__lte=up_to)
+    current, balance, last_id = None, 0, None
+    for entry_id, user_id, transaction_type, points in entries.values_list(
+        'id', 'user_id', 'transaction_type', 'points'
+    ).iterator(chunk_size=chunk_size):
+        if user_id != current:
+            if current is not None:
+                yield current, balance, last_id
+            current, balance = user_id, 0
+        balance += signed_points(transaction_type, points)
+        last_id = entry_id
+    if current is not None:
+        yield current, balance, last_id
@@ -0,0 +1,120 @@
+# accounts/referrals.py
+# Referral tree. UserProfile.referred_by links each member to whoever
+# referred them; ReferralClosure stores every (ancestor, descendant) pair of
+# that tree with the number of levels between them, so "everyone below this
+# member" and per-referrer totals are one indexed query instead of a walk
+# down the tree. Members are not stored as their own ancestors.
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+
+from .models import UserProfile, ReferralClosure
+from store.models import Order
+
+# Orders counted towards downstream revenue; matches total revenue on the dashboard
+REVENUE_STATUSES = [status for status, label in Order.ORDER_STATUS_CHOICES if status != 'cancelled']
+
+
+class ReferralCycle(ValueError):
+    pass
+
+
+def set_referrer(user_id, referrer_id):
+    """Move ``user_id`` and everyone below it under ``referrer_id`` (or detach it if None).
+
+    Only updates the closure table; the caller sets ``referred_by``. For a new
+    member this inserts one row per level above the referrer.
+    """
+    with transaction.atomic():
+        subtree = {user_id: 0}
+        subtree.update(ReferralClosure.objects.filter(ancestor_id=user_id).values_list('descendant_id', 'depth'))
+        if referrer_id in subtree:
+            raise ReferralCycle(f'User {referrer_id} is referred by {user_id}')
+
+        # Cut the subtree off from its current referrers
+        ReferralClosure.objects.filter(
+            descendant_id__in=list(subtree),
+        ).exclude(ancestor_id__in=list(subtree)).delete()
+        if referrer_id is None:
+            return
+
+        ancestors = [(referrer_id, 0)]
+        ancestors.extend(ReferralClosure.objects.filter(descendant_id=referrer_id).values_list('ancestor_id', 'depth'))
+        ReferralClosure.objects.bulk_create([
+            ReferralClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=above + below + 1)
+            for ancestor_id, above in ancestors
+            for descendant_id, below in subtree.items()
+        ], batch_size=1000)
+
+
+def detach_member(user_id):
+    """Drop the rows linking ``user_id``'s referrers to the members below it"""
+    ReferralClosure.objects.filter(
+        ancestor_id__in=ReferralClosure.objects.filter(descendant_id=user_id).values('ancestor_id'),
+        descendant_id__in=ReferralClosure.objects.filter(ancestor_id=user_id).values('descendant_id'),
+    ).delete()
+
+
+def rebuild_closure(chunk_size=5000):
+    """Recompute the whole closure table from referred_by.
+
+    Returns ``(rows, cycles)`` where ``cycles`` lists members whose chain of
+    referrers loops back on itself; their chains stop before the loop.
+    """
+    parents = dict(
+        UserProfile.objects.filter(referred_by__isnull=False).values_list('user_id', 'referred_by_id').iterator(
+            chunk_size=chunk_size
+        )
+    )
+    rows = 0
+    cycles = []
+    batch = []
+    with transaction.atomic():
+        ReferralClosure.objects.all().delete()
+        for user_id, parent_id in parents.items():
+            seen = {user_id}
+            depth = 1
+            while parent_id is not None:
+                if parent_id in seen:
+                    cycles.append(user_id)
+                    break
+                seen.add(parent_id)
+                batch.append(ReferralClosure(ancestor_id=parent_id, descendant_id=user_id, depth=depth))
+                parent_id = parents.get(parent_id)
+                depth += 1
+            if len(batch) >= chunk_size:
+                ReferralClosure.objects.bulk_create(batch)
+                rows += len(batch)
+                batch = []
+        ReferralClosure.objects.bulk_create(batch)
+        rows += len(batch)
+    return rows, cycles
+
+
+def top_referrers(limit=20):
+    """Referrers with the most members below them, with counts per level"""
+    return ReferralClosure.objects.values('ancestor_id', 'ancestor__username').annotate(
+        members=Count('pk'),
+        direct=Count('pk', filter=Q(depth=1)),
+        second_level=Count('pk', filter=Q(depth=2)),
+        deeper=Count('pk', filter=Q(depth__gte=3)),
+        max_depth=Max('depth'),
+    ).order_by('-members', 'ancestor_id')[:limit]
+
+
+def top_referrers_by_revenue(limit=20):
+    """Referrers whose downstream members have spent the most"""
+    return ReferralClosure.objects.filter(descendant__order__status__in=REVENUE_STATUSES).values(
+        'ancestor_id', 'ancestor__username'
+    ).annotate(
+        revenue=Sum('descendant__order__total_amount'),
+        orders=Count('descendant__order'),
+        buyers=Count('descendant_id', distinct=True),
+    ).order_by('-revenue', 'ancestor_id')[:limit]
+
+
+def referral_levels(user_id):
+    """Members and revenue per level below ``user_id``"""
+    return ReferralClosure.objects.filter(ancestor_id=user_id).values('depth').annotate(
+        members=Count('descendant_id', distinct=True),
+        revenue=Sum('descendant__order__total_amount', filter=Q(descendant__order__status__in=REVENUE_STATUSES)),
+    ).order_by('depth')
@@ -0,0 +1,43 @@
+# accounts/tests.py
+from django.contrib.auth.models import User
+
+from store.tests import ChangelistQueriesTestCase, StoreTestCase, make_user
+
+from .models import PointsHistory, UserProfile
+from .points import add_points, ledger_balance, stream_balances
+from .referrals import set_referrer
+
+
+def make_referred_user():
+    user, referrer = make_user(), make_user()
+    UserProfile.objects.filter(user=user).update(referred_by=referrer)
+    set_referrer(user.pk, referrer.pk)
+    return user
+
+
+def make_points_history():
+    return add_points(make_user(), 'earned', 10, 'Order')
+
+
+class AccountsChangelistQueriesTests(ChangelistQueriesTestCase):
+
+    def test_user(self):
+        self.assertChangelistQueriesConstant(User, make_referred_user)
+
+    def test_user_profile(self):
+        self.assertChangelistQueriesConstant(UserProfile, make_referred_user)
+
+    def test_points_history(self):
+        self.assertChangelistQueriesConstant(PointsHistory, make_points_history)
+
+
+class PointsLedgerTests(StoreTestCase):
+
+    def test_balances_agree(self):
+        user = make_user()
+        add_points(user, 'earned', 120, 'Order')
+        add_points(user, 'referral', 50, 'Referral')
+        add_points(user, 'redeemed', 100, 'Redeemed')
+        self.assertEqual(UserProfile.objects.get(user=user).points, 70)
+        self.assertEqual(ledger_balance(user), 70)
+        self.assertIn((user.pk, 70), [(user_id, balance) for user_id, balance, last_id in stream_balances()])
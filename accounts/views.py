@@ -7,7 +7,9 @@ from django.contrib import messages
 from django.contrib.auth.models import User
 from .models import UserProfile, PointsHistory
 from .forms import UserRegistrationForm
-from store.models import SiteSettings
+from .points import add_points
+from .referrals import set_referrer
+from store.site_settings import get_site_settings
 
 def register(request):
     if request.method == 'POST':
@@ -21,31 +23,28 @@ def register(request):
                 try:
                     referrer_profile = UserProfile.objects.get(referral_code=referral_code)
                     user.userprofile.referred_by = referrer_profile.user
+                    user.userprofile.save(update_fields=['referred_by'])
+                    set_referrer(user.pk, referrer_profile.user_id)
                     
                     # Add referral points
-                    settings = SiteSettings.objects.first()
-                    referral_points = settings.referral_points if settings else 50
+                    referral_points = get_site_settings().referral_points
                     
-                    referrer_profile.points += referral_points
-                    referrer_profile.save()
-                    
-                    user.userprofile.points += referral_points
-                    user.userprofile.save()
-                    
-                    # Record points history
-                    PointsHistory.objects.create(
-                        user=referrer_profile.user,
-                        transaction_type='referral',
-                        points=referral_points,
-                        description=f'Referral bonus for {user.username}'
+                    add_points(
+                        referrer_profile.user,
+                        'referral',
+                        referral_points,
+                        f'Referral bonus for {user.username}'
                     )
                     
-                    PointsHistory.objects.create(
-                        user=user,
-                        transaction_type='referral',
-                        points=referral_points,
-                        description='Welcome bonus for joining through referral'
+                    add_points(
+                        user,
+                        'referral',
+                        referral_points,
+                        'Welcome bonus for joining through referral'
                     )
+                    # Balance was updated in the database; don't let a later
+                    # profile save write the stale value back
+                    user.userprofile.refresh_from_db(fields=['points'])
                     
                 except UserProfile.DoesNotExist:
                     messages.warning(request, 'Invalid referral code')
@@ -0,0 +1,11 @@
+# ecommerce_project/asgi.py
+# ASGI entry point, e.g. `uvicorn ecommerce_project.asgi:application
+# --workers 4`. Storefront pages are served by the async views here.
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_project.settings')
+os.environ.setdefault('DJANGO_ASYNC_STOREFRONT', '1')
+
+application = get_asgi_application()
@@ -0,0 +1,36 @@
+# ecommerce_project/file_cache.py
+# FileBasedCache with add() and incr() that are atomic across processes.
+# Django's versions read the file and write it back, so two workers bumping
+# the same version stamp (store/versioning.py) could both write the same
+# value and one invalidation would be lost. Here both hold an exclusive lock
+# on a lock file in the cache directory while they run. Plain get() and
+# set() need no lock: set() writes a temporary file and renames it over the
+# old one.
+import os
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+LOCK_FILE = 'update.lock'
+
+
+class LockingFileBasedCache(FileBasedCache):
+    @contextmanager
+    def _update_lock(self):
+        self._createdir()
+        with open(os.path.join(self._dir, LOCK_FILE), 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._update_lock():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._update_lock():
+            return super().incr(key, delta, version)
@@ -26,6 +26,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.middleware.QueryStatsMiddleware',
+    'store.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,6 +39,11 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'ecommerce_project.urls'
 
+# Serve index, product_detail and cart with the async views in
+# store/async_views.py. asgi.py switches this on; under WSGI the sync views
+# are faster, since every async view would need its own event loop.
+ASYNC_STOREFRONT = os.environ.get('DJANGO_ASYNC_STOREFRONT') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -53,13 +60,81 @@ TEMPLATES = [
     },
 ]
 
+# WAL, tuned pragmas and BEGIN IMMEDIATE so concurrent checkouts queue for
+# the write lock instead of failing; see ecommerce_project/sqlite_backend
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'ecommerce_project.sqlite_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'busy_timeout': 5000,  # ms
+                'synchronous': 'NORMAL',
+                'cache_size': -64000,  # KiB
+                'mmap_size': 256 * 1024 * 1024,
+            },
+        },
+        # Keep connections open between requests; the pragmas are applied
+        # once per connection
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # A file rather than the in-memory default: the concurrency tests in
+        # store/tests.py write from several threads, which needs SQLite's
+        # file locking and busy_timeout
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Read replicas. Catalog and reporting views read from these (see
+# store/routers.py). To try it locally, point DATABASE_REPLICA_NAME at a
+# copy of db.sqlite3, or at db.sqlite3 itself to exercise the routing alone.
+# The alias always exists so the routing tests can use it as a mirror of
+# the test database; it only serves reads when DATABASE_REPLICA_NAME is set.
+DATABASES['replica'] = {
+    'ENGINE': 'ecommerce_project.sqlite_backend',
+    'NAME': os.environ.get('DATABASE_REPLICA_NAME', DATABASES['default']['NAME']),
+    'CONN_MAX_AGE': 600,
+    'TEST': {'MIRROR': 'default'},
+}
+READ_REPLICAS = ['replica'] if os.environ.get('DATABASE_REPLICA_NAME') else []
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write, so they see
+# their own changes while the replicas catch up. Must exceed replica lag.
+REPLICA_STICKY_SECONDS = 5
+
+# Catalog snapshots, rendered card fragments and the version stamps that
+# invalidate them (and the per-process SiteSettings) are kept here, so every
+# worker process must see the same cache. The default file cache is shared
+# by all workers on one host and bumps stamps under a file lock (see
+# ecommerce_project/file_cache.py). Across hosts set DJANGO_CACHE_URL to
+# redis://host:6379/0 (needs redis) or memcached://host:11211 (needs
+# pymemcache).
+CACHE_URL = os.environ.get('DJANGO_CACHE_URL', '')
+if CACHE_URL.startswith('redis://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL[len('memcached://'):],
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'ecommerce_project.file_cache.LockingFileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        # Cards, cart summaries and stamps add up; culling is a directory scan
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }}
+
+# Hold stock for items in a cart for this many seconds (None disables holds).
+# Expired holds are returned by `manage.py release_expired_reservations`.
+CART_RESERVATION_SECONDS = None
+
+# Fraction of requests timed by QueryStatsMiddleware (0 disables it). The
+# figures are per process and shown at admin/query-stats/.
+QUERY_STATS_SAMPLE_RATE = 0.1
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
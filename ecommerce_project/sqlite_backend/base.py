@@ -0,0 +1,61 @@
+# ecommerce_project/sqlite_backend/base.py
+# SQLite backend tuned for several worker processes writing at once. Each
+# new connection switches the database to WAL, so readers no longer wait
+# for the writer, and applies the pragmas below. Transactions start with
+# BEGIN IMMEDIATE: a transaction that reads first and writes later would
+# otherwise fail with "database is locked" when another writer got in
+# between, because SQLite cannot wait to upgrade a read lock. With the
+# write lock taken up front, busy_timeout queues writers instead.
+#
+# OPTIONS (besides the usual sqlite3.connect arguments):
+#   'pragmas': overrides for PRAGMA_DEFAULTS, e.g. {'busy_timeout': 10000}
+#   'transaction_mode': 'IMMEDIATE' (default), 'DEFERRED' or 'EXCLUSIVE'
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',
+    # NORMAL is durable in WAL mode except across a power loss, and avoids
+    # an fsync per commit
+    'synchronous': 'NORMAL',
+    # Milliseconds a statement waits for a lock before "database is locked"
+    'busy_timeout': 5000,
+    # Negative values are KiB: 64 MB of page cache per connection
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    @property
+    def pragmas(self):
+        return {**PRAGMA_DEFAULTS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'IMMEDIATE').upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}")
+        return mode
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = self.pragmas
+        # busy_timeout first so switching to WAL also waits for other writers
+        if 'busy_timeout' in pragmas:
+            conn.execute(f"PRAGMA busy_timeout = {int(pragmas['busy_timeout'])}")
+        for name, value in pragmas.items():
+            if name != 'busy_timeout' and not (name == 'journal_mode' and self.is_in_memory_db()):
+                conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -3,7 +3,11 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from django.db.models import Count
 from .models import *
+from . import search as product_search
+from .images import variant_url
+from .exports import export_response
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -19,27 +23,45 @@ class ProductOptionInline(admin.TabularInline):
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'base_price', 'points', 'is_active', 'image_preview']
+    list_select_related = ['category']
     list_filter = ['category', 'is_active', 'created_at']
     search_fields = ['name', 'description']
     list_editable = ['base_price', 'points', 'is_active']
     inlines = [ProductOptionInline]
     
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the search index instead of icontains scans
+        product_ids = product_search.search_ids(search_term)
+        if product_ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=product_ids), False
+    
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;">', obj.image.url)
+            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" loading="lazy">', variant_url(obj.image, 'thumb'))
         return "No Image"
     image_preview.short_description = "Image"
 
 @admin.register(ProductOption)
 class ProductOptionAdmin(admin.ModelAdmin):
     list_display = ['product', 'package_type', 'weight', 'price', 'stock_quantity']
+    list_select_related = ['product']
     list_filter = ['package_type', 'product__category']
     search_fields = ['product__name']
     list_editable = ['price', 'stock_quantity']
+    
+    def get_search_results(self, request, queryset, search_term):
+        product_ids = product_search.search_ids(search_term)
+        if product_ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(product_id__in=product_ids), False
 
 class ProductPromotionInline(admin.TabularInline):
     model = ProductPromotion
     extra = 1
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'promotion')
 
 @admin.register(Promotion)
 class PromotionAdmin(admin.ModelAdmin):
@@ -61,6 +83,7 @@ class PromotionAdmin(admin.ModelAdmin):
 @admin.register(ProductPromotion)
 class ProductPromotionAdmin(admin.ModelAdmin):
     list_display = ['product', 'promotion', 'promotional_price', 'promotion_active']
+    list_select_related = ['product', 'promotion']
     list_filter = ['promotion__is_active', 'promotion__start_date']
     search_fields = ['product__name', 'promotion__name']
     
@@ -68,6 +91,7 @@ class ProductPromotionAdmin(admin.ModelAdmin):
         return obj.promotion.is_active
     promotion_active.boolean = True
     promotion_active.short_description = "Active"
+    promotion_active.admin_order_field = 'promotion__is_active'
 
 @admin.register(CarouselImage)
 class CarouselImageAdmin(admin.ModelAdmin):
@@ -78,11 +102,22 @@ class CarouselImageAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="100" height="60" style="object-fit: cover;">', obj.image.url)
+            return format_html('<img src="{}" width="100" height="60" style="object-fit: cover;" loading="lazy">', variant_url(obj.image, 'thumb'))
         return "No Image"
     image_preview.short_description = "Preview"
 
-class CartItemInline(admin.TabularInline):
+class ProductOptionChoicesMixin:
+    # ProductOption.__str__ reads the product; load it with the options
+    # instead of once per choice in the select widget
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product_option':
+            kwargs['queryset'] = ProductOption.objects.select_related('product')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product_option__product')
+
+class CartItemInline(ProductOptionChoicesMixin, admin.TabularInline):
     model = CartItem
     extra = 0
     readonly_fields = ['get_total_price']
@@ -90,28 +125,40 @@ class CartItemInline(admin.TabularInline):
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'created_at', 'updated_at', 'item_count']
+    list_select_related = ['user']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['user__username', 'user__email']
     readonly_fields = ['created_at', 'updated_at']
     inlines = [CartItemInline]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(item_total=Count('items'))
+    
     def item_count(self, obj):
-        return obj.items.count()
+        return obj.item_total
     item_count.short_description = "Items"
+    item_count.admin_order_field = 'item_total'
 
-class OrderItemInline(admin.TabularInline):
+class OrderItemInline(ProductOptionChoicesMixin, admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ['get_total_price']
+    readonly_fields = ['total_price']
+    
+    def total_price(self, obj):
+        # The blank template row has no price yet
+        return obj.get_total_price() if obj.pk else '-'
+    total_price.short_description = "Total price"
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'user', 'total_amount', 'status', 'points_used', 'created_at']
+    list_select_related = ['user']
     list_filter = ['status', 'created_at']
     search_fields = ['order_number', 'user__username', 'user__email']
     readonly_fields = ['order_number', 'created_at', 'qr_code_preview']
     list_editable = ['status']
     inlines = [OrderItemInline]
+    actions = ['export_csv', 'export_jsonl']
     
     fieldsets = (
         ('Order Information', {
@@ -130,6 +177,18 @@ class OrderAdmin(admin.ModelAdmin):
             return format_html('<img src="{}" width="200">', obj.qr_code.url)
         return "No QR Code"
     qr_code_preview.short_description = "QR Code"
+    
+    # Narrow by status and date with the list filters (any date range works
+    # as ?created_at__gte=2024-01-01&created_at__lt=2024-02-01), then
+    # "Select all" to export every matching order. The file is streamed, not
+    # built in memory.
+    @admin.action(description="Export selected orders as CSV")
+    def export_csv(self, request, queryset):
+        return export_response(request, queryset, 'csv')
+    
+    @admin.action(description="Export selected orders as JSONL")
+    def export_jsonl(self, request, queryset):
+        return export_response(request, queryset, 'jsonl')
 
 @admin.register(SiteSettings)
 class SiteSettingsAdmin(admin.ModelAdmin):
@@ -0,0 +1,49 @@
+# store/aio.py
+# Helpers for the async views. Django's async ORM methods run every query of
+# a request on that request's single sync thread, so independent queries
+# issued with them still run one after another. gather_in_threads() runs
+# blocking functions on separate pool threads, each with its own database
+# connection, so they really overlap.
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+
+
+def _releasing_connections(func):
+    @wraps(func)
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Pool threads outlive the request, so request_finished never
+            # closes their connections; honour CONN_MAX_AGE here instead
+            close_old_connections()
+    return run
+
+
+def in_thread(func):
+    """``func`` as a coroutine function running on a pool thread"""
+    return sync_to_async(_releasing_connections(func), thread_sensitive=False)
+
+
+async def gather_in_threads(*calls):
+    """Run ``(func, *args)`` calls concurrently; returns their results in order"""
+    return await asyncio.gather(*(in_thread(func)(*args) for func, *args in calls))
+
+
+async def is_authenticated(request):
+    # Loads the lazy request.user off the event loop; Django 5 has request.auser()
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def async_login_required(view):
+    """login_required for async views; Django 4.2's decorator only wraps sync ones"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
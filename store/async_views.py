@@ -0,0 +1,54 @@
+# store/async_views.py
+# Async versions of the read-heavy storefront views, served instead of the
+# ones in views.py when ASYNC_STOREFRONT is on (ecommerce_project/asgi.py
+# turns it on). Under ASGI a request waiting on the database or on a slow
+# client holds no worker thread. Templates are still rendered on a thread:
+# they read request.user and the session lazily, which Django only allows
+# off the event loop.
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+
+from .aio import async_login_required, in_thread
+from .carts import get_cart_summary
+from .catalog import aget_catalog_snapshot
+from .models import Cart, Product, ProductOption
+from .promotions import promotion_index
+from .routers import use_replica
+from .views import _cart_context, _index_context, _product_detail_context
+
+arender = sync_to_async(render)
+
+
+@use_replica
+async def index(request):
+    snapshot = await aget_catalog_snapshot()
+    return await arender(request, 'store/index.html', _index_context(request, snapshot))
+
+
+async def _options(product_id):
+    return [option async for option in ProductOption.objects.filter(product_id=product_id)]
+
+
+@use_replica
+async def product_detail(request, product_id):
+    # The promotion lookup may have to reload the promotion index, so it
+    # runs on its own thread alongside the product queries
+    product, options, promotions = await asyncio.gather(
+        Product.objects.filter(id=product_id).afirst(),
+        _options(product_id),
+        in_thread(promotion_index.resolve)([product_id]),
+    )
+    if product is None:
+        raise Http404
+    context = _product_detail_context(product, options, promotions.get(product.id))
+    return await arender(request, 'store/product_detail.html', context)
+
+
+@async_login_required
+async def cart(request):
+    cart, created = await Cart.objects.aget_or_create(user=request.user)
+    summary = await sync_to_async(get_cart_summary)(cart)
+    return await arender(request, 'store/cart.html', _cart_context(cart, summary))
@@ -0,0 +1,169 @@
+# store/carts.py
+# Cart totals. A summary is computed from one query and cached under the
+# cart's version number, which every cart mutation bumps, and the catalog and
+# promotion stamps, which price and points edits bump.
+import math
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog import CATALOG_VERSION
+from .inventory import sync_cart_reservations
+from .promotions import PROMOTIONS_VERSION, price_cart_items, promotion_index
+from .versioning import get_versions
+
+CART_SUMMARY_MAX_AGE = 15 * 60  # seconds
+
+
+class CartSummary:
+    def __init__(self, items):
+        self.items = items
+        self.subtotal = sum((item.total_price for item in items), Decimal('0.00'))
+        self.item_count = sum(item.quantity for item in items)
+        self.points = sum(item.line_points for item in items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def build_cart_summary(cart, at=None):
+    # Line totals depend on the promotion in effect, so price_cart_items
+    # computes them; points do not
+    items = list(cart.items.select_related('product_option__product').annotate(
+        line_points=F('quantity') * F('product_option__product__points'),
+    ).order_by('id'))
+    return CartSummary(price_cart_items(items, at))
+
+
+def get_cart_summary(cart, cached=True):
+    """Summary for ``cart``, memoized on the instance and in the cache.
+
+    Pass ``cached=False`` where the totals must come straight from the
+    database, e.g. while placing an order.
+    """
+    if not cached:
+        return build_cart_summary(cart)
+    memo = getattr(cart, '_summary', None)
+    if memo is not None and memo[0] == cart.version:
+        return memo[1]
+
+    versions = get_versions([CATALOG_VERSION, PROMOTIONS_VERSION])
+    key = f'cart_summary:{cart.pk}:{cart.version}:{versions[CATALOG_VERSION]}:{versions[PROMOTIONS_VERSION]}'
+    summary = cache.get(key)
+    if summary is None:
+        now = timezone.now()
+        summary = build_cart_summary(cart, now)
+        timeout = CART_SUMMARY_MAX_AGE
+        # Prices change when a promotion starts or ends
+        boundary = promotion_index.next_boundary(now)
+        if boundary is not None:
+            timeout = max(1, min(timeout, math.ceil((boundary - now).total_seconds())))
+        cache.set(key, summary, timeout)
+    cart._summary = (cart.version, summary)
+    return summary
+
+
+class CartError(Exception):
+    pass
+
+
+class StaleCartError(CartError):
+    def __init__(self, version):
+        super().__init__('Cart has changed since this batch was prepared')
+        self.version = version
+
+
+def _quantity(change):
+    try:
+        return int(change.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise CartError('Invalid quantity')
+
+
+def _id(change, key):
+    try:
+        return int(change[key])
+    except (KeyError, TypeError, ValueError):
+        raise CartError(f'Missing or invalid {key}')
+
+
+def apply_cart_changes(cart, version, changes):
+    """Apply a batch of line changes to ``cart`` and return the new summary.
+
+    ``version`` is the cart version the client last saw; if the cart has
+    moved on since, nothing is applied and StaleCartError carries the
+    current version. Each change is a dict with an ``op`` of ``set``,
+    ``increment``, ``remove`` (by ``item_id``) or ``add`` (by
+    ``product_option_id``).
+    """
+    from .models import Cart, CartItem, ProductOption
+
+    with transaction.atomic():
+        # Claiming the version up front is what rejects stale batches; it
+        # costs one UPDATE and no read of the cart
+        claimed = Cart.objects.filter(pk=cart.pk, version=version).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        if not claimed:
+            raise StaleCartError(Cart.objects.filter(pk=cart.pk).values_list('version', flat=True).first())
+
+        items = {item.id: item for item in cart.items.all()}
+        by_option = {item.product_option_id: item for item in items.values()}
+        changed, removed, added = set(), set(), {}
+
+        for change in changes:
+            if not isinstance(change, dict):
+                raise CartError('Invalid change')
+            op = change.get('op')
+            if op == 'add':
+                option_id = _id(change, 'product_option_id')
+                quantity = _quantity(change)
+                if quantity <= 0:
+                    raise CartError('Invalid quantity')
+                item = by_option.get(option_id)
+                if item is not None and item.id not in removed:
+                    item.quantity += quantity
+                    changed.add(item.id)
+                else:
+                    added[option_id] = added.get(option_id, 0) + quantity
+                continue
+
+            item = items.get(_id(change, 'item_id'))
+            if item is None or item.id in removed:
+                raise CartError('Item not found')
+            if op == 'set':
+                item.quantity = _quantity(change)
+            elif op == 'increment':
+                item.quantity += _quantity(change)
+            elif op == 'remove':
+                item.quantity = 0
+            else:
+                raise CartError(f'Unknown operation: {op}')
+            if item.quantity <= 0:
+                removed.add(item.id)
+                changed.discard(item.id)
+            else:
+                changed.add(item.id)
+
+        if added:
+            known = set(ProductOption.objects.filter(id__in=added).values_list('id', flat=True))
+            if known != set(added):
+                raise CartError('Product option not found')
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product_option_id=option_id, quantity=quantity)
+                for option_id, quantity in added.items()
+            ])
+        if changed:
+            CartItem.objects.bulk_update([items[item_id] for item_id in changed], ['quantity'])
+        if removed:
+            CartItem.objects.filter(id__in=removed).delete()
+
+    # Summarize after commit so nothing is cached under a version that could
+    # still roll back
+    cart.version = version + 1
+    cart._summary = None
+    sync_cart_reservations(cart)
+    return get_cart_summary(cart)
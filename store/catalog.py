@@ -0,0 +1,184 @@
+# store/catalog.py
+# Precomputed storefront catalog used by the home page. The snapshot is plain
+# data (no model instances) so it can be cached and served without touching
+# the database. Product tabs are served a page at a time, ordered by
+# (name, id) and paginated by keyset so deep pages cost the same as the first.
+import base64
+import binascii
+import hashlib
+import json
+import math
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .aio import gather_in_threads
+from .images import variant_url
+from .models import CarouselImage, Category, Product
+from .promotions import promotion_index, promotional_price
+from .routers import primary_reads
+from .versioning import aget_version, bump_version, get_version
+
+CATALOG_VERSION = 'catalog'
+CATALOG_MAX_AGE = 60 * 60  # seconds, upper bound when no promotion boundary is near
+CAROUSEL_SIZE = 5
+TAB_PAGE_SIZE = 24
+MAX_TAB_PAGE_SIZE = 100
+
+CATEGORY_TYPES = [category_type for category_type, label in Category.CATEGORY_CHOICES]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(product):
+    return base64.urlsafe_b64encode(json.dumps([product['name'], product['id']]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        name, product_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return str(name), int(product_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def _product_card(product, promo):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'image_url': variant_url(product.image, 'card'),
+        'image_webp_url': variant_url(product.image, 'card', webp=True),
+        'base_price': product.base_price,
+        'points': product.points,
+        'category': product.category.name,
+        'promotion': {'price': promo.price, 'tag': promo.tag} if promo else None,
+        'options': [
+            {
+                'id': option.id,
+                'package_type': option.package_type,
+                'package_label': option.get_package_type_display(),
+                'weight': option.weight,
+                'price': option.price,
+                'promo_price': promotional_price(option.price, product.base_price, promo),
+            }
+            for option in product.options.all()
+        ],
+    }
+
+
+def build_product_page(category_type, cursor=None, limit=TAB_PAGE_SIZE, now=None):
+    """One page of a product tab: ``{'products': [...], 'next_cursor': ...}``"""
+    now = now or timezone.now()
+    products = Product.objects.filter(is_active=True, category__category_type=category_type)
+    if cursor:
+        name, product_id = decode_cursor(cursor)
+        products = products.filter(Q(name__gt=name) | Q(name=name, id__gt=product_id))
+    products = list(products.select_related('category').prefetch_related('options').order_by('name', 'id')[:limit + 1])
+
+    has_more = len(products) > limit
+    products = products[:limit]
+    resolved = promotion_index.resolve([product.id for product in products], now)
+    cards = [_product_card(product, resolved.get(product.id)) for product in products]
+    return {
+        'products': cards,
+        'next_cursor': encode_cursor(cards[-1]) if has_more else None,
+    }
+
+
+def _cache_timeout(built_at, expires_at):
+    timeout = CATALOG_MAX_AGE
+    if expires_at is not None:
+        remaining = (expires_at - built_at).total_seconds()
+        timeout = max(1, min(timeout, math.ceil(remaining)))
+    return timeout
+
+
+def get_product_page(category_type, cursor=None, limit=TAB_PAGE_SIZE):
+    """Cached product tab page; raises InvalidCursor for a malformed cursor"""
+    if not cursor and limit == TAB_PAGE_SIZE:
+        return get_catalog_snapshot()['tabs'][category_type]
+    # Cursors are client input of any length; key on what they decode to
+    position = hashlib.md5(json.dumps(decode_cursor(cursor)).encode()).hexdigest() if cursor else ''
+    key = f'catalog_page:{get_version(CATALOG_VERSION)}:{category_type}:{limit}:{position}'
+    page = cache.get(key)
+    if page is None:
+        now = timezone.now()
+        with primary_reads():
+            page = build_product_page(category_type, cursor, limit, now)
+        cache.set(key, page, _cache_timeout(now, promotion_index.next_boundary(now)))
+    return page
+
+
+def _build_carousel():
+    return [
+        {
+            'title': image.title,
+            'image_url': variant_url(image.image, 'detail'),
+            'image_webp_url': variant_url(image.image, 'detail', webp=True),
+            'link': image.link,
+        }
+        for image in CarouselImage.objects.filter(is_active=True)[:CAROUSEL_SIZE]
+    ]
+
+
+def _snapshot(now, expires_at, carousel, tabs):
+    promotions = {
+        product['id']: product['promotion']
+        for page in tabs.values()
+        for product in page['products']
+        if product['promotion']
+    }
+    return {
+        'built_at': now,
+        'expires_at': expires_at,
+        'carousel': carousel,
+        'tabs': tabs,
+        'promotions': promotions,
+    }
+
+
+def build_catalog_snapshot(now=None):
+    now = now or timezone.now()
+    # Only the first page of each tab; the rest is fetched page by page
+    tabs = {category_type: build_product_page(category_type, now=now) for category_type in CATEGORY_TYPES}
+    return _snapshot(now, promotion_index.next_boundary(now), _build_carousel(), tabs)
+
+
+async def abuild_catalog_snapshot(now=None):
+    """build_catalog_snapshot, loading the carousel, tabs and promotions concurrently"""
+    now = now or timezone.now()
+    carousel, expires_at, *pages = await gather_in_threads(
+        (_build_carousel,),
+        (promotion_index.next_boundary, now),
+        *((build_product_page, category_type, None, TAB_PAGE_SIZE, now) for category_type in CATEGORY_TYPES),
+    )
+    return _snapshot(now, expires_at, carousel, dict(zip(CATEGORY_TYPES, pages)))
+
+
+def get_catalog_snapshot():
+    key = f'catalog_snapshot:{get_version(CATALOG_VERSION)}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        # Cached until the next invalidation, so never built from a lagging replica
+        with primary_reads():
+            snapshot = build_catalog_snapshot()
+        cache.set(key, snapshot, _cache_timeout(snapshot['built_at'], snapshot['expires_at']))
+    return snapshot
+
+
+async def aget_catalog_snapshot():
+    key = f'catalog_snapshot:{await aget_version(CATALOG_VERSION)}'
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        with primary_reads():
+            snapshot = await abuild_catalog_snapshot()
+        await cache.aset(key, snapshot, _cache_timeout(snapshot['built_at'], snapshot['expires_at']))
+    return snapshot
+
+
+def invalidate_catalog_snapshot():
+    bump_version(CATALOG_VERSION)
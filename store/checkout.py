@@ -0,0 +1,99 @@
+# store/checkout.py
+# Order placement. Everything runs in one transaction with a fixed number of
+# queries, however many lines the cart has.
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from accounts.models import UserProfile, PointsHistory
+from .models import Order, OrderItem
+from .carts import get_cart_summary
+from .inventory import consume_cart_stock, InsufficientStockError
+from .rollups import record_order_items
+from .sequences import allocate_order_number
+from .site_settings import get_site_settings
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+def place_order(user, cart, points_to_use=0):
+    if points_to_use < 0:
+        raise CheckoutError('Invalid points amount')
+
+    points_rate = get_site_settings().points_to_currency_rate
+    # Drawn before the transaction so the number comes from this process's
+    # reserved block rather than a reservation that could roll back
+    order_number = allocate_order_number()
+
+    with transaction.atomic():
+        summary = get_cart_summary(cart, cached=False)
+        if not summary:
+            raise EmptyCartError('Your cart is empty!')
+
+        cart_items = summary.items
+        quantities = defaultdict(int)
+        for item in cart_items:
+            quantities[item.product_option_id] += item.quantity
+        try:
+            consume_cart_stock(cart, quantities)
+        except InsufficientStockError as e:
+            raise CheckoutError(str(e))
+
+        earned_points = summary.points
+        points_discount = min(points_to_use * points_rate, summary.subtotal)
+
+        # Spend and earn in one conditional update so concurrent checkouts
+        # can never take the balance below zero
+        updated = UserProfile.objects.filter(user=user, points__gte=points_to_use).update(
+            points=F('points') - points_to_use + earned_points
+        )
+        if not updated:
+            raise CheckoutError('You do not have enough points')
+
+        order = Order.objects.create(
+            user=user,
+            order_number=order_number,
+            total_amount=summary.subtotal - points_discount,
+            points_used=points_to_use,
+            points_discount=points_discount
+        )
+
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_option=item.product_option,
+                quantity=item.quantity,
+                price=item.unit_price
+            )
+            for item in cart_items
+        ])
+        # bulk_create skips signals, so count the items towards the rollups here
+        record_order_items(order, order_items)
+
+        history = []
+        if points_to_use > 0:
+            history.append(PointsHistory(
+                user=user,
+                transaction_type='redeemed',
+                points=points_to_use,
+                description=f'Redeemed for order {order.order_number}'
+            ))
+        history.append(PointsHistory(
+            user=user,
+            transaction_type='earned',
+            points=earned_points,
+            description=f'Earned from order {order.order_number}'
+        ))
+        PointsHistory.objects.bulk_create(history)
+
+        cart.items.all().delete()
+        cart.mark_changed()
+
+    return order
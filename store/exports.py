@@ -0,0 +1,129 @@
+# store/exports.py
+# Streaming order exports for finance. Orders are read by keyset on pk,
+# CHUNK_SIZE at a time, with one query for the orders and one for their
+# items per chunk. Only one chunk is held in memory, and each query stays
+# cheap however deep into the table the export is. Every chunk is rendered
+# to one string and handed to the response (or file) before the next one
+# is read.
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .aio import in_thread
+from .models import Order, OrderItem
+
+CHUNK_SIZE = 1000
+
+ORDER_FIELDS = ['order_number', 'created_at', 'customer', 'status', 'total_amount', 'points_used', 'points_discount']
+ITEM_FIELDS = ['product', 'package_type', 'weight', 'quantity', 'price', 'line_total']
+CSV_HEADER = ORDER_FIELDS + ITEM_FIELDS
+
+
+def _day_start(day):
+    start = datetime.combine(day, time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def filter_orders(queryset=None, start=None, end=None, statuses=None):
+    """Orders created from ``start`` through ``end`` (dates, both inclusive) in ``statuses``"""
+    if queryset is None:
+        queryset = Order.objects.all()
+    # Plain comparisons on created_at, so an index on it can be used
+    if start:
+        queryset = queryset.filter(created_at__gte=_day_start(start))
+    if end:
+        queryset = queryset.filter(created_at__lt=_day_start(end + timedelta(days=1)))
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    return queryset
+
+
+def order_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Yield lists of up to ``chunk_size`` order dicts from ``queryset``, each with its ``items``"""
+    queryset = queryset.order_by('pk').annotate(customer=F('user__username')).values('pk', *ORDER_FIELDS)
+    last_pk = 0
+    while True:
+        orders = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not orders:
+            return
+        last_pk = orders[-1]['pk']
+
+        by_pk = {}
+        for order in orders:
+            order['items'] = []
+            by_pk[order.pop('pk')] = order
+        items = OrderItem.objects.filter(order_id__in=by_pk).order_by('order_id', 'pk').values_list(
+            'order_id', 'product_option__product__name', 'product_option__package_type',
+            'product_option__weight', 'quantity', 'price',
+        )
+        for order_id, product, package_type, weight, quantity, price in items:
+            by_pk[order_id]['items'].append({
+                'product': product,
+                'package_type': package_type,
+                'weight': weight,
+                'quantity': quantity,
+                'price': price,
+                'line_total': price * quantity,
+            })
+        yield orders
+
+
+def render_csv(chunks):
+    """One CSV row per order item; orders without items get one row with the item columns empty"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for orders in chunks:
+        for order in orders:
+            head = [order[field] for field in ORDER_FIELDS]
+            head[1] = head[1].isoformat()
+            for item in order['items'] or [None]:
+                writer.writerow(head + ([item[field] for field in ITEM_FIELDS] if item else [''] * len(ITEM_FIELDS)))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def render_jsonl(chunks):
+    """One JSON object per order, with its items nested"""
+    for orders in chunks:
+        yield ''.join(json.dumps(order, cls=DjangoJSONEncoder) + '\n' for order in orders)
+
+
+FORMATS = {
+    'csv': (render_csv, 'text/csv'),
+    'jsonl': (render_jsonl, 'application/x-ndjson'),
+}
+
+
+async def _pull_in_thread(content):
+    # Under ASGI Django 4.2 would list() a sync iterator before sending it,
+    # holding the whole export in memory; pull one chunk at a time instead
+    next_chunk = in_thread(next)
+    while True:
+        chunk = await next_chunk(content, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def export_response(request, queryset, file_format, chunk_size=CHUNK_SIZE):
+    """StreamingHttpResponse with ``queryset`` exported as ``file_format``"""
+    render, content_type = FORMATS[file_format]
+    content = render(order_chunks(queryset, chunk_size))
+    if isinstance(request, ASGIRequest):
+        content = _pull_in_thread(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    filename = f"orders-{date.today():%Y%m%d}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,88 @@
+# store/fragments.py
+# Rendered HTML of the home page product cards and tab bodies, cached per
+# language. Rendering a card means translating its labels and formatting
+# its prices, the same for every visitor, so each card is rendered once per
+# product version and language and reused across requests and workers.
+#
+# A card is keyed by the fragment generation, the product's version stamp,
+# the language and the promotion in effect. Product, ProductOption and
+# ProductPromotion changes bump the product's stamp. Promotions also start
+# and end on schedule without any write, so the promotion is part of the key
+# too. A tab body is keyed by the keys of its cards. warm_fragment_cache
+# starts a new generation after a deploy, so fragments rendered with older
+# templates are never served.
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+from .versioning import bump_version, get_versions
+
+FRAGMENTS_VERSION = 'fragments'
+FRAGMENT_TIMEOUT = 24 * 60 * 60  # seconds; stale generations and versions just age out
+CARD_TEMPLATE = 'store/includes/product_card.html'
+TAB_TEMPLATE = 'store/includes/product_tab_body.html'
+
+
+def _product_version(product_id):
+    return f'product:{product_id}'
+
+
+def _digest(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def _card_keys(cards, language):
+    versions = get_versions([FRAGMENTS_VERSION] + [_product_version(card['id']) for card in cards])
+    generation = versions[FRAGMENTS_VERSION]
+    keys = []
+    for card in cards:
+        promotion = card['promotion']
+        promo = _digest(f"{promotion['price']}:{promotion['tag']}")[:12] if promotion else '-'
+        version = versions[_product_version(card['id'])]
+        keys.append(f"fragment:card:{generation}:{card['id']}:{version}:{language}:{promo}")
+    return keys
+
+
+def _render_cards(cards, keys, language):
+    found = cache.get_many(keys)
+    missing = {key: card for key, card in zip(keys, cards) if key not in found}
+    if missing:
+        with translation.override(language):
+            rendered = {key: render_to_string(CARD_TEMPLATE, {'product': card}) for key, card in missing.items()}
+        cache.set_many(rendered, FRAGMENT_TIMEOUT)
+        found.update(rendered)
+    return [mark_safe(found[key]) for key in keys]
+
+
+def render_cards(cards, language=None):
+    """Rendered HTML of each card dict from store.catalog, in ``language`` (default: active)"""
+    language = language or translation.get_language()
+    return _render_cards(cards, _card_keys(cards, language), language)
+
+
+def render_tab(cards, language=None):
+    """Rendered row of cards for a tab, cached as one fragment; empty for no cards"""
+    if not cards:
+        return ''
+    language = language or translation.get_language()
+    keys = _card_keys(cards, language)
+    key = f"fragment:tab:{_digest(' '.join(keys))}"
+    html = cache.get(key)
+    if html is None:
+        with translation.override(language):
+            html = render_to_string(TAB_TEMPLATE, {'cards': _render_cards(cards, keys, language)})
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return mark_safe(html)
+
+
+def invalidate_product_fragments(product_ids):
+    for product_id in set(product_ids):
+        bump_version(_product_version(product_id))
+
+
+def invalidate_fragments():
+    """Stop serving every cached fragment, e.g. after the card template changed"""
+    bump_version(FRAGMENTS_VERSION)
@@ -0,0 +1,96 @@
+# store/images.py
+# Resized copies of uploaded product and carousel images. Every original gets
+# a JPEG and a WebP file per variant, stored next to each other under
+# variants/<original name>/, so a variant's name follows from the original's
+# and needs no database column. Until its variants exist an image is served
+# at its original URL.
+import os
+import threading
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# name -> (width, height, crop to fill instead of fitting inside)
+VARIANTS = {
+    'thumb': (100, 100, True),
+    'card': (400, 400, True),
+    'detail': (1200, 1200, False),
+}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+_known = set()
+_known_lock = threading.Lock()
+
+
+def variant_name(name, variant, webp=False):
+    stem = os.path.splitext(name)[0]
+    return f"variants/{stem}/{variant}.{'webp' if webp else 'jpg'}"
+
+
+def has_variants(name):
+    with _known_lock:
+        if name in _known:
+            return True
+    # The largest one is written last
+    if default_storage.exists(variant_name(name, 'detail', webp=True)):
+        with _known_lock:
+            _known.add(name)
+        return True
+    return False
+
+
+def variant_url(image, variant, webp=False):
+    """URL of ``image`` (a FieldFile) at ``variant`` size, or of the original"""
+    if not image:
+        return ''
+    if not has_variants(image.name):
+        return image.url
+    return default_storage.url(variant_name(image.name, variant, webp))
+
+
+def _encode(image, fmt, quality):
+    buffer = BytesIO()
+    if fmt == 'JPEG':
+        image.save(buffer, fmt, quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def _save(name, data):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(data))
+
+
+def render_variants(name, force=False):
+    """Write every variant of the stored image ``name``; returns False if skipped"""
+    if not force and has_variants(name):
+        return False
+    with default_storage.open(name, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'L'):
+        # JPEG has no alpha channel; flatten transparent images onto white
+        background = Image.new('RGB', original.size, 'white')
+        rgba = original.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        original = background
+
+    for variant, (width, height, crop) in VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(original, (width, height), Image.LANCZOS)
+        else:
+            resized = original.copy()
+            resized.thumbnail((width, height), Image.LANCZOS)
+        _save(variant_name(name, variant), _encode(resized, 'JPEG', JPEG_QUALITY))
+        _save(variant_name(name, variant, webp=True), _encode(resized, 'WEBP', WEBP_QUALITY))
+
+    with _known_lock:
+        _known.add(name)
+    return True
+
@@ -0,0 +1,144 @@
+# store/inventory.py
+# Stock keeping for product options. Every change to stock_quantity is a
+# single conditional UPDATE, so concurrent checkouts never read-modify-write
+# a row and can never take stock below zero.
+#
+# Carts can optionally hold stock for CART_RESERVATION_SECONDS. Held stock is
+# already taken out of stock_quantity; checkout uses the hold first and
+# release_expired_reservations hands back holds that ran out.
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+
+from .models import ProductOption, StockReservation
+
+
+class InsufficientStockError(Exception):
+    pass
+
+
+def reservation_ttl():
+    seconds = getattr(settings, 'CART_RESERVATION_SECONDS', None)
+    return timedelta(seconds=seconds) if seconds else None
+
+
+def take_stock(quantities):
+    """Remove ``{option_id: quantity}`` from stock in one statement.
+
+    All or nothing: raises InsufficientStockError if any option is short, and
+    the caller's transaction must then roll back.
+    """
+    quantities = {option_id: quantity for option_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    enough = Q()
+    for option_id, quantity in quantities.items():
+        enough |= Q(pk=option_id, stock_quantity__gte=quantity)
+    updated = ProductOption.objects.filter(enough).update(stock_quantity=Case(
+        *[When(pk=option_id, then=F('stock_quantity') - quantity) for option_id, quantity in quantities.items()]
+    ))
+    if updated != len(quantities):
+        raise InsufficientStockError('Some items in your cart are out of stock')
+
+
+def return_stock(quantities):
+    """Put ``{option_id: quantity}`` back into stock in one statement"""
+    quantities = {option_id: quantity for option_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    ProductOption.objects.filter(pk__in=quantities).update(stock_quantity=Case(
+        *[When(pk=option_id, then=F('stock_quantity') + quantity) for option_id, quantity in quantities.items()]
+    ))
+
+
+def sync_cart_reservations(cart):
+    """Make the cart's holds match its lines, as far as stock allows.
+
+    Holds are best effort: a line that can't be held in full keeps what it
+    already had, and checkout decides whether the rest is still available.
+    """
+    ttl = reservation_ttl()
+    if ttl is None:
+        return
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        wanted = dict(
+            cart.items.values('product_option_id').annotate(total=Sum('quantity')).values_list('product_option_id', 'total')
+        )
+        held = {reservation.product_option_id: reservation for reservation in cart.reservations.all()}
+
+        for option_id in set(wanted) | set(held):
+            want = wanted.get(option_id, 0)
+            reservation = held.get(option_id)
+            have = reservation.quantity if reservation else 0
+            if want > have:
+                try:
+                    with transaction.atomic():
+                        take_stock({option_id: want - have})
+                    have = want
+                except InsufficientStockError:
+                    pass
+            elif want < have:
+                return_stock({option_id: have - want})
+                have = want
+
+            if reservation is None and have:
+                StockReservation.objects.create(cart=cart, product_option_id=option_id, quantity=have, expires_at=expires_at)
+            elif reservation is not None and not have:
+                reservation.delete()
+            elif reservation is not None:
+                StockReservation.objects.filter(pk=reservation.pk).update(quantity=have, expires_at=expires_at)
+
+
+def consume_cart_stock(cart, quantities):
+    """Take ``{option_id: quantity}`` out of stock for an order from ``cart``.
+
+    Must run inside the checkout transaction. The cart's holds are used
+    first, only the remainder is taken from free stock, and any surplus hold
+    goes back.
+    """
+    held = {}
+    if reservation_ttl() is not None:
+        reservations = list(StockReservation.objects.select_for_update().filter(cart=cart))
+        held = {reservation.product_option_id: reservation.quantity for reservation in reservations}
+        if reservations:
+            StockReservation.objects.filter(pk__in=[reservation.pk for reservation in reservations]).delete()
+
+    take_stock({option_id: quantity - held.get(option_id, 0) for option_id, quantity in quantities.items()})
+    return_stock({option_id: quantity - quantities.get(option_id, 0) for option_id, quantity in held.items()})
+
+
+def release_cart_reservations(cart):
+    with transaction.atomic():
+        reservations = list(StockReservation.objects.select_for_update().filter(cart=cart))
+        _release(reservations)
+
+
+def release_expired_reservations(batch_size=1000):
+    """Return expired holds to stock; returns how many holds were released"""
+    released = 0
+    now = timezone.now()
+    while True:
+        with transaction.atomic():
+            # Holds a checkout is consuming right now are skipped, not waited on
+            reservations = list(
+                StockReservation.objects.select_for_update(skip_locked=True).filter(expires_at__lte=now)[:batch_size]
+            )
+            _release(reservations)
+        released += len(reservations)
+        if len(reservations) < batch_size:
+            return released
+
+
+def _release(reservations):
+    if not reservations:
+        return
+    quantities = defaultdict(int)
+    for reservation in reservations:
+        quantities[reservation.product_option_id] += reservation.quantity
+    StockReservation.objects.filter(pk__in=[reservation.pk for reservation in reservations]).delete()
+    return_stock(quantities)
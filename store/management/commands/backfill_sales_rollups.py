@@ -0,0 +1,59 @@
+# Rebuild the daily sales rollups read by the admin dashboard from the order
+# history, one chunk of orders at a time.
+# Usage: python manage.py backfill_sales_rollups --chunk-size 5000
+
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from store.models import Order, OrderItem, DailySalesRollup, DailyProductSales
+from store.rollups import add_sales, add_product_sales
+
+
+class Command(BaseCommand):
+    help = 'Backfill daily sales rollups from existing orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # Orders created after this point are counted live by the signals
+        last_id = Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        DailySalesRollup.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+
+        start = 0
+        processed = 0
+        while start < last_id:
+            end = Order.objects.filter(pk__gt=start, pk__lte=last_id).order_by('pk').values_list(
+                'pk', flat=True
+            )[chunk_size - 1:chunk_size].first() or last_id
+            orders = Order.objects.filter(pk__gt=start, pk__lte=end)
+
+            with transaction.atomic():
+                sales = orders.annotate(day=TruncDate('created_at')).values('day', 'status').annotate(
+                    orders=Count('pk'), revenue=Sum('total_amount')
+                )
+                for row in sales:
+                    add_sales(row['day'], row['status'], row['orders'], row['revenue'])
+                    processed += row['orders']
+
+                products = defaultdict(dict)
+                items = OrderItem.objects.filter(order__in=orders).annotate(
+                    day=TruncDate('order__created_at')
+                ).values('day', 'product_option__product').annotate(
+                    units=Sum('quantity'), lines=Count('pk')
+                )
+                for row in items:
+                    products[row['day']][row['product_option__product']] = (row['units'], row['lines'])
+                for day, totals in products.items():
+                    add_product_sales(day, totals)
+
+            self.stdout.write(f'{processed} orders rolled up (through order {end})')
+            start = end
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled rollups for {processed} orders'))
@@ -0,0 +1,169 @@
+# Measure checkout throughput with several processes checking out at once,
+# the way separate worker processes would. Each writer fills its own cart
+# and places orders in a loop. Two database setups are compared: 'stock' is
+# Django's own SQLite backend with a rollback journal and a connection per
+# request, 'tuned' is the DATABASES setting (WAL, pragmas, BEGIN IMMEDIATE,
+# persistent connections). Every run works on a fresh copy of the database,
+# so the real one is never written to. Needs fork (Linux/macOS) and data
+# from generate_synthetic_data.
+# Usage: python manage.py benchmark_checkout --writers 1 4 8 [--checkouts 50] [--modes stock tuned]
+
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+from django.test.utils import override_settings
+from store.checkout import CheckoutError, place_order
+from store.models import Cart, CartItem, ProductOption
+from .benchmark_views import percentile
+
+MODES = ('stock', 'tuned')
+ITEMS_PER_ORDER = 2
+
+
+def _use_database(mode, path):
+    """Point the default connection of this (forked) process at ``path``"""
+    database = connections.settings['default']
+    database['NAME'] = path
+    if mode == 'stock':
+        database.update(ENGINE='django.db.backends.sqlite3', OPTIONS={}, CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+    try:
+        # Drop the wrapper inherited from the parent so a new one is built
+        del connections['default']
+    except AttributeError:
+        pass
+
+
+def _writer(mode, path, media_root, user_id, option_ids, checkouts, seed, start, results):
+    _use_database(mode, path)
+    # Order QR codes are written by background tasks; keep them out of MEDIA_ROOT
+    override_settings(MEDIA_ROOT=media_root).enable()
+    rng = random.Random(seed)
+    placed = locked = rejected = 0
+    latencies = []
+    start.wait()
+
+    user = None
+    for n in range(checkouts):
+        try:
+            # One request fills the cart, the next one checks out
+            if user is None:
+                user = User.objects.get(pk=user_id)
+            cart, created = Cart.objects.get_or_create(user=user)
+            for option_id in rng.sample(option_ids, ITEMS_PER_ORDER):
+                CartItem.objects.get_or_create(cart=cart, product_option_id=option_id, defaults={'quantity': 1})
+            cart.mark_changed()
+            close_old_connections()
+
+            started = time.perf_counter()
+            place_order(user, cart)
+            latencies.append((time.perf_counter() - started) * 1000)
+            placed += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+        except CheckoutError:
+            rejected += 1
+        finally:
+            close_old_connections()
+
+    results.put({'placed': placed, 'locked': locked, 'rejected': rejected, 'latencies': latencies})
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent checkout throughput on SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 8], help='Parallel writer processes')
+        parser.add_argument('--checkouts', type=int, default=50, help='Checkouts attempted per writer')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        source = connections['default'].settings_dict
+        if connections['default'].vendor != 'sqlite' or connections['default'].is_in_memory_db():
+            raise CommandError('benchmark_checkout needs a file-based SQLite database')
+
+        user_ids = list(
+            User.objects.filter(is_staff=False, userprofile__isnull=False).order_by('pk').values_list('pk', flat=True)[
+                :max(options['writers'])
+            ]
+        )
+        option_ids = list(ProductOption.objects.filter(
+            product__is_active=True, stock_quantity__gte=100
+        ).values_list('pk', flat=True))
+        if len(user_ids) < max(options['writers']) or len(option_ids) < ITEMS_PER_ORDER:
+            raise CommandError('Not enough customers or stocked products; run generate_synthetic_data first')
+
+        # Forked writers must not share the parent's connection
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            for writers in options['writers']:
+                for mode in options['modes']:
+                    path = os.path.join(workdir, f'{mode}-{writers}.sqlite3')
+                    self.copy_database(source['NAME'], path, mode)
+                    results[mode, writers] = self.run(
+                        context, mode, path, workdir, user_ids[:writers], option_ids, options
+                    )
+                    os.remove(path)
+                    self.report(mode, writers, results[mode, writers])
+
+        if len(options['modes']) == len(MODES):
+            for writers in options['writers']:
+                stock, tuned = results['stock', writers], results['tuned', writers]
+                if stock['throughput']:
+                    self.stdout.write(f"{writers} writers: tuned is {tuned['throughput'] / stock['throughput']:.1f}x stock")
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def copy_database(self, source, target, mode):
+        with sqlite3.connect(source) as original, sqlite3.connect(target) as copy:
+            original.backup(copy)
+            copy.execute(f"PRAGMA journal_mode = {'DELETE' if mode == 'stock' else 'WAL'}")
+        original.close()
+        copy.close()
+
+    def run(self, context, mode, path, workdir, user_ids, option_ids, options):
+        start = context.Event()
+        queue = context.Queue()
+        processes = [
+            context.Process(target=_writer, args=(
+                mode, path, workdir, user_id, option_ids, options['checkouts'], options['seed'] + n, start, queue
+            ))
+            for n, user_id in enumerate(user_ids)
+        ]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start.set()
+        outcomes = [queue.get() for process in processes]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        latencies = [latency for outcome in outcomes for latency in outcome['latencies']]
+        placed = sum(outcome['placed'] for outcome in outcomes)
+        return {
+            'placed': placed,
+            'locked': sum(outcome['locked'] for outcome in outcomes),
+            'rejected': sum(outcome['rejected'] for outcome in outcomes),
+            'throughput': placed / elapsed,
+            'p50': percentile(latencies, 0.5) if latencies else 0,
+            'p95': percentile(latencies, 0.95) if latencies else 0,
+        }
+
+    def report(self, mode, writers, result):
+        line = (
+            f"{mode:<6} {writers:>3} writers  {result['throughput']:7.1f} checkouts/s  "
+            f"p50 {result['p50']:6.1f}ms  p95 {result['p95']:7.1f}ms  "
+            f"{result['placed']} placed, {result['locked']} locked, {result['rejected']} rejected"
+        )
+        self.stdout.write(self.style.WARNING(line) if result['locked'] else line)
@@ -0,0 +1,209 @@
+# Compare requests per second of the storefront served through WSGI with the
+# sync views and through ASGI with the async ones, at the same worker count.
+# Clients are simulated in process. Each response takes --client-delay
+# seconds to deliver, like a slow mobile client. A WSGI worker is blocked
+# for that time; an ASGI worker serves other requests meanwhile. Each mode
+# runs in its own subprocess because the choice of views is fixed when the
+# URLconf loads. Load data with generate_synthetic_data first.
+# Usage: python manage.py benchmark_serving [--workers 4 --clients 64 --duration 10 --client-delay 0.05]
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from store.models import Cart, Product
+from .benchmark_views import percentile
+
+MODES = ('sync', 'async')
+HOST = 'localhost'
+
+
+def wsgi_environ(path, cookie):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'HTTP_COOKIE': cookie,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def asgi_scope(path, cookie):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 50000),
+        'server': (HOST, 80),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare sync WSGI and async ASGI storefront throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads / ASGI event loops')
+        parser.add_argument('--clients', type=int, default=64, help='Concurrent simulated clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per mode')
+        parser.add_argument('--client-delay', type=float, default=0.05, help='Seconds each response takes to deliver')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+        # Set by the parent when it runs one mode in a subprocess
+        parser.add_argument('--run-mode', choices=MODES, help=argparse.SUPPRESS)
+        parser.add_argument('--paths', nargs='+', help=argparse.SUPPRESS)
+        parser.add_argument('--cookie', default='', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['run_mode']:
+            result = self.serve(options['run_mode'], options)
+            self.stdout.write(json.dumps(result))
+            return
+
+        paths, cookie = self.prepare()
+        for mode in options['modes']:
+            env = {**os.environ, 'DJANGO_ASYNC_STOREFRONT': '1' if mode == 'async' else '0'}
+            command = [
+                sys.executable, sys.argv[0], 'benchmark_serving', '--run-mode', mode,
+                '--workers', str(options['workers']), '--clients', str(options['clients']),
+                '--duration', str(options['duration']), '--client-delay', str(options['client_delay']),
+                '--cookie', cookie, '--paths', *paths,
+            ]
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            if completed.returncode:
+                raise CommandError(f'{mode} run failed:\n{completed.stderr}')
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{mode:<5} {options['workers']} workers, {options['clients']} clients: "
+                f"{result['rps']:7.1f} req/s  p50 {result['p50']:6.1f}ms  p95 {result['p95']:6.1f}ms  "
+                f"{result['errors']} errors"
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def prepare(self):
+        """Paths to request and the session cookie of a customer with a cart"""
+        cart = Cart.objects.filter(items__isnull=False).select_related('user').first()
+        product = Product.objects.filter(is_active=True).order_by('pk').first()
+        if cart is None or product is None:
+            raise CommandError('Need products and a customer with a cart; run generate_synthetic_data first')
+        client = Client()
+        client.force_login(cart.user)
+        cookie = f"sessionid={client.cookies['sessionid'].value}"
+        return ['/', f'/product/{product.pk}/', '/cart/'], cookie
+
+    def serve(self, mode, options):
+        paths, cookie = options['paths'], options['cookie']
+        delay = options['client_delay']
+        latencies, errors = [], []
+        deadline = [None]
+
+        if mode == 'sync':
+            application = get_wsgi_application()
+
+            def handle(path):
+                statuses = []
+                response = application(wsgi_environ(path, cookie), lambda status, headers: statuses.append(status))
+                try:
+                    for chunk in response:
+                        pass
+                    # The worker stays busy until the client has the response
+                    time.sleep(delay)
+                finally:
+                    getattr(response, 'close', lambda: None)()
+                return statuses[0].startswith('200')
+
+            pool = ThreadPoolExecutor(max_workers=options['workers'])
+
+            def client(n):
+                while time.perf_counter() < deadline[0]:
+                    started = time.perf_counter()
+                    ok = pool.submit(handle, paths[n % len(paths)]).result()
+                    (latencies if ok else errors).append((time.perf_counter() - started) * 1000)
+                    n += 1
+
+            for path in paths:
+                pool.submit(handle, path).result()
+            deadline[0] = time.perf_counter() + options['duration']
+            threads = [threading.Thread(target=client, args=(n,)) for n in range(options['clients'])]
+        else:
+            application = get_asgi_application()
+
+            async def handle(path):
+                messages = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+                statuses = []
+
+                async def receive():
+                    return next(messages, {'type': 'http.disconnect'})
+
+                async def send(message):
+                    if message['type'] == 'http.response.start':
+                        statuses.append(message['status'])
+                    elif not message.get('more_body'):
+                        # Delivering to a slow client; the loop serves others meanwhile
+                        await asyncio.sleep(delay)
+
+                await application(asgi_scope(path, cookie), receive, send)
+                return statuses[0] == 200
+
+            async def client(n):
+                while time.perf_counter() < deadline[0]:
+                    started = time.perf_counter()
+                    ok = await handle(paths[n % len(paths)])
+                    (latencies if ok else errors).append((time.perf_counter() - started) * 1000)
+                    n += 1
+
+            async def worker(first, count):
+                await asyncio.gather(*(client(n) for n in range(first, first + count)))
+
+            async def warm_up():
+                for path in paths:
+                    await handle(path)
+
+            asyncio.run(warm_up())
+            deadline[0] = time.perf_counter() + options['duration']
+            per_worker = max(1, options['clients'] // options['workers'])
+            threads = [
+                threading.Thread(target=asyncio.run, args=(worker(n * per_worker, per_worker),))
+                for n in range(options['workers'])
+            ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.5) if latencies else 0,
+            'p95': percentile(latencies, 0.95) if latencies else 0,
+            'errors': len(errors),
+        }
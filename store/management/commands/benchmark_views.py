@@ -0,0 +1,170 @@
+# Drive the storefront views and the admin dashboard through the test client
+# and report latency percentiles and query counts per view. Results can be
+# saved as a baseline and later runs compared against it; the command fails
+# when a view needs more queries or its p90 got slower than the tolerance.
+# Everything runs in one transaction that is rolled back, so checkouts don't
+# leave orders behind. Load data with generate_synthetic_data first.
+# Usage: python manage.py benchmark_views --iterations 50 [--save-baseline bench.json | --baseline bench.json]
+
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+from store.models import Product, Cart, CartItem
+
+VIEWS = ['index', 'product_detail', 'cart', 'checkout', 'process_checkout', 'profile', 'admin_dashboard']
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main views and compare against a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per view before measuring')
+        parser.add_argument('--views', nargs='+', choices=VIEWS, default=VIEWS)
+        parser.add_argument('--user', help='Customer to benchmark as; defaults to one with a cart')
+        parser.add_argument('--admin', help='Staff user for the dashboard; defaults to the first superuser')
+        parser.add_argument('--baseline', help='Compare against this baseline file')
+        parser.add_argument('--save-baseline', help='Write the results to this file')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p90 slowdown, 0.25 = 25%%')
+        parser.add_argument('--slack-ms', type=float, default=5.0, help='p90 slowdowns below this are noise')
+
+    def handle(self, *args, **options):
+        # Lets the test client through ALLOWED_HOSTS
+        setup_test_environment()
+
+        customer = self.get_customer(options['user'])
+        admin = self.get_admin(options['admin'])
+        self.products = list(Product.objects.filter(is_active=True).order_by('?').values_list('pk', flat=True)[:50])
+        if not self.products:
+            raise CommandError('No products found; run generate_synthetic_data first')
+        cart = Cart.objects.filter(user=customer).first() or Cart.objects.create(user=customer)
+        self.cart_lines = list(cart.items.values_list('product_option_id', 'quantity'))
+        if not self.cart_lines:
+            raise CommandError(f'{customer.username} has an empty cart')
+
+        self.customer_client = Client()
+        self.customer_client.force_login(customer)
+        self.admin_client = Client()
+        self.admin_client.force_login(admin)
+
+        results = {}
+        with transaction.atomic():
+            for view in options['views']:
+                results[view] = self.run_view(view, cart, options['iterations'], options['warmup'])
+                self.report(view, results[view])
+            transaction.set_rollback(True)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'], options['slack_ms'])
+        else:
+            self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def get_customer(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No user {username}')
+        customer = User.objects.filter(
+            is_staff=False, cart__items__isnull=False, userprofile__isnull=False
+        ).annotate(orders=Count('order', distinct=True)).order_by('-orders').first()
+        if customer is None:
+            raise CommandError('No customer with a cart found; run generate_synthetic_data first')
+        return customer
+
+    def get_admin(self, username):
+        admin = User.objects.filter(username=username) if username else User.objects.filter(is_superuser=True)
+        admin = admin.filter(is_staff=True).order_by('pk').first()
+        if admin is None:
+            raise CommandError('No staff user found for the admin dashboard')
+        return admin
+
+    def refill_cart(self, cart):
+        cart.items.all().delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_option_id=option_id, quantity=quantity)
+            for option_id, quantity in self.cart_lines
+        ])
+        cart.mark_changed()
+
+    def request(self, view, cart, n):
+        client = self.customer_client
+        if view == 'index':
+            return client.get(reverse('index'))
+        if view == 'product_detail':
+            return client.get(reverse('product_detail', args=[self.products[n % len(self.products)]]))
+        if view == 'cart':
+            return client.get(reverse('cart'))
+        if view == 'checkout':
+            return client.get(reverse('checkout'))
+        if view == 'process_checkout':
+            return client.post(reverse('process_checkout'), {'points_to_use': 0})
+        if view == 'profile':
+            return client.get(reverse('profile'))
+        return self.admin_client.get(reverse('admin:admin_dashboard'))
+
+    def run_view(self, view, cart, iterations, warmup):
+        timings, queries = [], []
+        for n in range(warmup + iterations):
+            if view == 'process_checkout':
+                # Untimed: every checkout empties the cart
+                self.refill_cart(cart)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self.request(view, cart, n)
+                elapsed = time.perf_counter() - started
+            if view == 'process_checkout':
+                if response.status_code != 302 or '/payment/' not in response.url:
+                    raise CommandError(f'{view} did not place an order')
+            elif response.status_code != 200:
+                raise CommandError(f'{view} returned {response.status_code}')
+            if n >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p90_ms': round(percentile(timings, 0.9), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': max(queries),
+        }
+
+    def report(self, view, result):
+        self.stdout.write(
+            f"{view:<18} p50 {result['p50_ms']:>8.2f}ms  p90 {result['p90_ms']:>8.2f}ms  "
+            f"p99 {result['p99_ms']:>8.2f}ms  {result['queries']:>4} queries"
+        )
+
+    def compare(self, results, path, tolerance, slack_ms):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for view, result in results.items():
+            before = baseline.get(view)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(f"{view}: {before['queries']} -> {result['queries']} queries")
+            if result['p90_ms'] > max(before['p90_ms'] * (1 + tolerance), before['p90_ms'] + slack_ms):
+                regressions.append(f"{view}: p90 {before['p90_ms']}ms -> {result['p90_ms']}ms")
+
+        if regressions:
+            raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
@@ -0,0 +1,72 @@
+# Check that every store/accounts admin changelist runs the same number of
+# queries whatever the page size, i.e. nothing is fetched per row, against
+# the data in this database. A changelist with no more rows than the smaller
+# page size proves nothing and fails; generate_synthetic_data provides rows.
+# store/tests.py and accounts/tests.py check the same on generated rows.
+# Usage: python manage.py check_admin_queries [--small 5 --large 50]
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+APP_LABELS = ('store', 'accounts', 'auth')
+
+
+class Command(BaseCommand):
+    help = 'Verify admin changelists issue a constant number of queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=5)
+        parser.add_argument('--large', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # Lets the test client through ALLOWED_HOSTS
+        setup_test_environment()
+        small, large = options['small'], options['large']
+        failures = []
+
+        with transaction.atomic():
+            superuser = User.objects.create_superuser('admin-query-check', 'admin-query-check@example.com', None)
+            client = Client()
+            client.force_login(superuser)
+
+            for model, model_admin in sorted(admin.site._registry.items(), key=lambda item: item[0]._meta.label):
+                if model._meta.app_label not in APP_LABELS:
+                    continue
+                url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+                rows = model._default_manager.count()
+                counts = [self.count_queries(client, model_admin, url, size) for size in (small, large)]
+
+                label = f'{model._meta.label:<28} {counts[0]:>3} / {counts[1]:>3} queries'
+                if rows <= small:
+                    failures.append(model._meta.label)
+                    self.stdout.write(self.style.ERROR(f'{label}  only {rows} rows, need more than {small}'))
+                elif counts[0] != counts[1]:
+                    failures.append(model._meta.label)
+                    self.stdout.write(self.style.ERROR(f'{label}  grows with page size'))
+                else:
+                    self.stdout.write(f'{label}  ok')
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"Per-row queries or too few rows in: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('All changelists run a constant number of queries'))
+
+    def count_queries(self, client, model_admin, url, per_page):
+        previous = model_admin.list_per_page
+        model_admin.list_per_page = per_page
+        try:
+            # Untimed first request so one-off lookups aren't counted
+            client.get(url)
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+        finally:
+            model_admin.list_per_page = previous
+        if response.status_code != 200:
+            raise CommandError(f'{url} returned {response.status_code}')
+        return len(captured)
@@ -0,0 +1,54 @@
+# Generate resized JPEG/WebP variants for every product and carousel image,
+# spread over worker processes. Images that already have variants are
+# skipped unless --force is given.
+# Usage: python manage.py generate_image_variants [--workers 8] [--force]
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from store.catalog import invalidate_catalog_snapshot
+from store.fragments import invalidate_fragments
+from store.images import render_variants
+from store.models import Product, CarouselImage
+
+
+def _render(name, force):
+    try:
+        return name, render_variants(name, force), None
+    except Exception as e:
+        return name, False, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized image variants for existing media'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--force', action='store_true', help='Regenerate existing variants')
+
+    def handle(self, *args, **options):
+        names = set(Product.objects.exclude(image='').values_list('image', flat=True))
+        names |= set(CarouselImage.objects.exclude(image='').values_list('image', flat=True))
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+
+        rendered = skipped = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [executor.submit(_render, name, options['force']) for name in sorted(names)]
+            for future in as_completed(futures):
+                name, done, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                elif done:
+                    rendered += 1
+                else:
+                    skipped += 1
+
+        invalidate_catalog_snapshot()
+        invalidate_fragments()
+        self.stdout.write(self.style.SUCCESS(
+            f'{rendered} images rendered, {skipped} already done, {failed} failed'
+        ))
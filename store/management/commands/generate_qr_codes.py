@@ -0,0 +1,18 @@
+# Render payment QR codes for orders that don't have one yet, e.g. when the
+# process was restarted before its background worker got to them.
+# Usage: python manage.py generate_qr_codes
+
+from django.core.management.base import BaseCommand
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Generate missing order QR codes'
+
+    def handle(self, *args, **options):
+        count = 0
+        for order in Order.objects.filter(qr_code='').iterator(chunk_size=500):
+            order.generate_qr_code()
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Generated {count} QR codes'))
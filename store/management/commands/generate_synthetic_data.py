@@ -0,0 +1,271 @@
+# Fill the database with synthetic customers, catalog, promotions, carts,
+# orders and points history for benchmarking. Everything is bulk inserted,
+# then the caches and rollups that the skipped signals would have maintained
+# are rebuilt. Scale 1 is 1,000 users, 200 products and about 3,000 orders.
+# Usage: python manage.py generate_synthetic_data --scale 10 [--seed 1]
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from accounts.codes import assign_codes
+from accounts.models import UserProfile, PointsHistory
+from store import search
+from store.catalog import invalidate_catalog_snapshot
+from store.models import (
+    Category, Product, ProductOption, Promotion, ProductPromotion,
+    Cart, CartItem, Order, OrderItem,
+)
+from store.promotions import PROMOTIONS_VERSION
+from store.sequences import allocate_order_number
+from store.versioning import bump_version
+
+PACKAGES = [
+    ('small', '250g', Decimal('0.5')),
+    ('medium', '500g', Decimal('1.0')),
+    ('large', '1kg', Decimal('1.9')),
+    ('extra_large', '2kg', Decimal('3.6')),
+    ('family_pack', '5kg', Decimal('8.5')),
+]
+STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+STATUS_WEIGHTS = [15, 10, 10, 60, 5]
+CENT = Decimal('0.01')
+REFERRAL_RATE = 0.4
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic data for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--prefix', default='synthetic', help='Prefix for generated usernames and names')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users generated per transaction')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        scale = options['scale']
+        users = max(1, int(1000 * scale))
+        products = max(1, int(200 * scale))
+        promotions = max(1, int(10 * scale))
+
+        self.now = timezone.now()
+        self.password = make_password('synthetic')
+
+        with transaction.atomic():
+            self.ensure_admin()
+            options_by_product = self.generate_catalog(products)
+            self.generate_promotions(promotions, options_by_product)
+        self.stdout.write(f'{products} products, {products * len(PACKAGES)} options, {promotions} promotions')
+
+        self.option_prices = {
+            option.pk: (option.price, option.product_id, points)
+            for product_id, (points, product_options) in options_by_product.items()
+            for option in product_options
+        }
+        self.option_ids = list(self.option_prices)
+
+        start = User.objects.filter(username__startswith=f'{self.prefix}_user').count()
+        self.member_ids = []
+        created = 0
+        orders = 0
+        while created < users:
+            size = min(options['chunk_size'], users - created)
+            orders += self.generate_customers(start + created, size)
+            created += size
+            self.stdout.write(f'{created} users, {orders} orders')
+
+        # Bulk inserts skip the signals that keep these up to date
+        bump_version(PROMOTIONS_VERSION)
+        invalidate_catalog_snapshot()
+        search.rebuild_index()
+        call_command('backfill_sales_rollups', stdout=self.stdout)
+        call_command('backfill_referral_closure', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f'Generated {users} users and {orders} orders'))
+
+    def ensure_admin(self):
+        username = f'{self.prefix}_admin'
+        if not User.objects.filter(username=username).exists():
+            User.objects.create_superuser(username=username, email=f'{username}@example.com', password='synthetic')
+
+    def generate_catalog(self, count):
+        categories = []
+        for category_type in ('vegetable', 'fruit', 'other'):
+            for n in range(5):
+                category, created = Category.objects.get_or_create(
+                    name=f'{self.prefix.title()} {category_type} {n + 1}',
+                    defaults={'category_type': category_type}
+                )
+                categories.append(category)
+
+        first = Product.objects.filter(name__startswith=f'{self.prefix.title()} product').count()
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'{self.prefix.title()} product {first + n + 1}',
+                category=self.random.choice(categories),
+                description='Synthetic product for benchmarking.',
+                base_price=Decimal(self.random.randint(1500, 25000)) / 100,
+                points=self.random.randint(1, 15),
+            )
+            for n in range(count)
+        ], batch_size=1000)
+        if products[0].pk is None:
+            products = list(Product.objects.filter(name__in=[product.name for product in products]))
+
+        ProductOption.objects.bulk_create([
+            ProductOption(
+                product=product,
+                package_type=package_type,
+                weight=weight,
+                price=(product.base_price * multiplier).quantize(CENT),
+                stock_quantity=self.random.randint(50, 1000),
+            )
+            for product in products
+            for package_type, weight, multiplier in PACKAGES
+        ], batch_size=1000)
+
+        options_by_product = {}
+        for option in ProductOption.objects.filter(product__in=products).select_related('product'):
+            options_by_product.setdefault(option.product_id, (option.product.points, []))[1].append(option)
+        return options_by_product
+
+    def generate_promotions(self, count, options_by_product):
+        product_ids = list(options_by_product)
+        base_prices = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'base_price'))
+        promotions = []
+        for n in range(count):
+            start = self.now + timedelta(days=self.random.randint(-30, 5))
+            promotions.append(Promotion(
+                name=f'{self.prefix.title()} promotion {n + 1}',
+                discount_rate=Decimal(self.random.choice([5, 10, 15, 20, 25])),
+                start_date=start,
+                end_date=start + timedelta(days=self.random.randint(3, 45)),
+                tag_text=self.random.choice(['SALE', 'HOT', 'NEW']),
+            ))
+        promotions = Promotion.objects.bulk_create(promotions)
+        if promotions[0].pk is None:
+            promotions = list(Promotion.objects.filter(name__in=[promotion.name for promotion in promotions]))
+
+        product_promotions = []
+        for promotion in promotions:
+            for product_id in self.random.sample(product_ids, min(len(product_ids), self.random.randint(5, 20))):
+                price = base_prices[product_id] * (100 - promotion.discount_rate) / 100
+                product_promotions.append(ProductPromotion(
+                    product_id=product_id, promotion=promotion, promotional_price=price.quantize(CENT)
+                ))
+        ProductPromotion.objects.bulk_create(product_promotions, batch_size=1000)
+
+    def generate_customers(self, first, count):
+        """Create ``count`` users with profiles, carts, orders and points history"""
+        order_counts = [self.random.choice([0, 1, 2, 3, 3, 4, 5, 8]) for n in range(count)]
+        # Reserve order numbers up front so they come from whole blocks
+        order_numbers = [allocate_order_number() for n in range(sum(order_counts))]
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=f'{self.prefix}_user{first + n}',
+                    email=f'{self.prefix}_user{first + n}@example.com',
+                    password=self.password,
+                    date_joined=self.now - timedelta(days=self.random.randint(30, 720)),
+                )
+                for n in range(count)
+            ])
+            if users[0].pk is None:
+                users = list(User.objects.filter(username__in=[user.username for user in users]).order_by('pk'))
+
+            orders, dates, items, history, balances = [], [], [], [], {}
+            for user, order_count in zip(users, order_counts):
+                balance = 0
+                for n in range(order_count):
+                    order, order_items, earned = self.make_order(user, order_numbers.pop())
+                    dates.append(self.now - timedelta(days=self.random.randint(0, 180), seconds=self.random.randint(0, 86399)))
+                    used = 0
+                    if balance >= 100 and self.random.random() < 0.2:
+                        used = self.random.randint(1, balance // 100) * 100
+                        order.points_used = used
+                        order.points_discount = (used * Decimal('0.10')).quantize(CENT)
+                        order.total_amount = max(order.total_amount - order.points_discount, Decimal(0))
+                        history.append(PointsHistory(
+                            user=user, transaction_type='redeemed', points=used,
+                            description=f'Used for order {order.order_number}'
+                        ))
+                    if order.status != 'cancelled':
+                        balance += earned - used
+                        history.append(PointsHistory(
+                            user=user, transaction_type='earned', points=earned,
+                            description=f'Order {order.order_number}'
+                        ))
+                    else:
+                        balance -= used
+                    orders.append(order)
+                    items.append(order_items)
+                balances[user.pk] = balance
+
+            profiles = []
+            for user in users:
+                # Earlier members, including earlier ones in this chunk, refer
+                # some of the new ones, which builds referral chains
+                referrer_id = None
+                if self.member_ids and self.random.random() < REFERRAL_RATE:
+                    referrer_id = self.random.choice(self.member_ids)
+                profiles.append(UserProfile(user=user, points=balances[user.pk], referred_by_id=referrer_id))
+                self.member_ids.append(user.pk)
+            UserProfile.objects.bulk_create(assign_codes(profiles))
+            PointsHistory.objects.bulk_create(history, batch_size=1000)
+
+            created = Order.objects.bulk_create(orders, batch_size=1000)
+            if created and created[0].pk is None:
+                by_number = dict(Order.objects.filter(
+                    order_number__in=[order.order_number for order in orders]
+                ).values_list('order_number', 'pk'))
+                for order in orders:
+                    order.pk = by_number[order.order_number]
+            # created_at is auto_now_add, so back-date the orders afterwards
+            for order, created_at in zip(orders, dates):
+                order.created_at = created_at
+            Order.objects.bulk_update(orders, ['created_at'], batch_size=1000)
+            for order, order_items in zip(orders, items):
+                for item in order_items:
+                    item.order = order
+            OrderItem.objects.bulk_create([item for order_items in items for item in order_items], batch_size=1000)
+
+            self.generate_carts(users)
+        return len(orders)
+
+    def make_order(self, user, order_number):
+        order_items, total, earned = [], Decimal(0), 0
+        for option_id in self.random.sample(self.option_ids, min(len(self.option_ids), self.random.randint(1, 5))):
+            price, product_id, points = self.option_prices[option_id]
+            quantity = self.random.randint(1, 4)
+            order_items.append(OrderItem(product_option_id=option_id, quantity=quantity, price=price))
+            total += price * quantity
+            earned += points * quantity
+        order = Order(
+            user=user,
+            order_number=order_number,
+            total_amount=total,
+            status=self.random.choices(STATUSES, STATUS_WEIGHTS)[0],
+        )
+        return order, order_items, earned
+
+    def generate_carts(self, users):
+        shoppers = [user for user in users if self.random.random() < 0.3]
+        if not shoppers:
+            return
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in shoppers])
+        if carts[0].pk is None:
+            carts = list(Cart.objects.filter(user__in=shoppers))
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_option_id=option_id, quantity=self.random.randint(1, 3))
+            for cart in carts
+            for option_id in self.random.sample(self.option_ids, min(len(self.option_ids), self.random.randint(1, 6)))
+        ], batch_size=1000)
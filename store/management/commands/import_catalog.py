@@ -0,0 +1,216 @@
+# Stream a CSV or JSONL catalog into the store in batches.
+# Each CSV row (or JSONL object) describes one package option together with
+# its product and category:
+#   category, category_type, product, description, base_price, points,
+#   is_active, package_type, weight, price, stock_quantity
+# A JSONL object may instead describe a whole product with an "options" list.
+# Products are matched by name and options by (product, package_type), so
+# re-running the same file only updates what changed.
+# Usage: python manage.py import_catalog catalog.csv [--batch-size 2000]
+
+import csv
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from store import search
+from store.catalog import invalidate_catalog_snapshot
+from store.fragments import invalidate_product_fragments
+from store.models import Category, Product, ProductOption
+
+CATEGORY_TYPES = {value for value, label in Category.CATEGORY_CHOICES}
+PACKAGE_TYPES = {value for value, label in ProductOption.PACKAGE_CHOICES}
+PRODUCT_FIELDS = ['category_id', 'description', 'base_price', 'points', 'is_active']
+
+
+def _read_rows(path, file_format):
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, row
+            return
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            options = record.pop('options', None)
+            if options is None:
+                yield line_number, record
+            else:
+                for option in options:
+                    yield line_number, {**record, **option}
+
+
+def _decimal(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _parse(line_number, row):
+    try:
+        category_type = row.get('category_type') or 'other'
+        package_type = row['package_type']
+        if category_type not in CATEGORY_TYPES:
+            raise ValueError(f'unknown category_type {category_type!r}')
+        if package_type not in PACKAGE_TYPES:
+            raise ValueError(f'unknown package_type {package_type!r}')
+        stock = row.get('stock_quantity')
+        return {
+            'category': row['category'].strip(),
+            'category_type': category_type,
+            'product': row['product'].strip(),
+            'description': row.get('description') or '',
+            'base_price': _decimal(row.get('base_price') or row['price']),
+            'points': int(row.get('points') or 5),
+            'is_active': _bool(row.get('is_active', True)),
+            'package_type': package_type,
+            'weight': row.get('weight') or '',
+            'price': _decimal(row['price']),
+            'stock_quantity': int(stock) if stock not in (None, '') else None,
+        }
+    except (KeyError, ValueError, InvalidOperation, AttributeError) as e:
+        raise CommandError(f'Line {line_number}: {e!r}')
+
+
+class Command(BaseCommand):
+    help = 'Import products, options and prices from a CSV or JSONL catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Option rows per batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        batch_size = options['batch_size']
+
+        # Categories are few; keep them all in memory
+        self.categories = {category.name: category for category in Category.objects.all()}
+        self.counts = dict.fromkeys(['products_created', 'products_updated', 'options_created', 'options_updated'], 0)
+
+        started = time.perf_counter()
+        rows = (_parse(line_number, row) for line_number, row in _read_rows(path, file_format))
+        total = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                indexed = self._import_batch(batch)
+            # Bulk writes skip the model signals that keep the index and the
+            # cached cards current
+            search.index_products(indexed)
+            invalidate_product_fragments(indexed)
+            total += len(batch)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{total} rows ({total / elapsed:.0f} rows/s)')
+
+        invalidate_catalog_snapshot()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s): '
+            + ', '.join(f'{count} {name.replace("_", " ")}' for name, count in self.counts.items())
+        ))
+
+    def _import_batch(self, batch):
+        """Import one batch; returns the ids of products created or changed"""
+        self._import_categories(batch)
+        products, touched = self._import_products(batch)
+        self._import_options(batch, products)
+        return touched
+
+    def _import_categories(self, batch):
+        wanted = {}
+        for row in batch:
+            wanted.setdefault(row['category'], row['category_type'])
+        new = [Category(name=name, category_type=category_type)
+               for name, category_type in wanted.items() if name not in self.categories]
+        changed = []
+        for name, category_type in wanted.items():
+            category = self.categories.get(name)
+            if category is not None and category.category_type != category_type:
+                category.category_type = category_type
+                changed.append(category)
+        if new:
+            Category.objects.bulk_create(new)
+            for category in Category.objects.filter(name__in=[category.name for category in new]):
+                self.categories[category.name] = category
+        if changed:
+            Category.objects.bulk_update(changed, ['category_type'])
+
+    def _import_products(self, batch):
+        wanted = {}
+        for row in batch:
+            wanted[row['product']] = {
+                'category_id': self.categories[row['category']].pk,
+                'description': row['description'],
+                'base_price': row['base_price'],
+                'points': row['points'],
+                'is_active': row['is_active'],
+            }
+        existing = {}
+        for product in Product.objects.filter(name__in=wanted).order_by('-pk'):
+            existing[product.name] = product
+
+        new, changed = [], []
+        for name, fields in wanted.items():
+            product = existing.get(name)
+            if product is None:
+                new.append(Product(name=name, **fields))
+                continue
+            if any(getattr(product, field) != value for field, value in fields.items()):
+                for field, value in fields.items():
+                    setattr(product, field, value)
+                changed.append(product)
+        if new:
+            Product.objects.bulk_create(new)
+            for product in Product.objects.filter(name__in=[product.name for product in new]).order_by('-pk'):
+                existing[product.name] = product
+        if changed:
+            Product.objects.bulk_update(changed, PRODUCT_FIELDS)
+        self.counts['products_created'] += len(new)
+        self.counts['products_updated'] += len(changed)
+        return existing, [existing[product.name].pk for product in new + changed]
+
+    def _import_options(self, batch, products):
+        wanted = {}
+        for row in batch:
+            fields = {'weight': row['weight'], 'price': row['price']}
+            if row['stock_quantity'] is not None:
+                fields['stock_quantity'] = row['stock_quantity']
+            wanted[(products[row['product']].pk, row['package_type'])] = fields
+
+        existing = {
+            (option.product_id, option.package_type): option
+            for option in ProductOption.objects.filter(product_id__in={key[0] for key in wanted})
+        }
+        # Changed options grouped by the fields their rows supplied. Writing
+        # stock_quantity for a row without it would put back the value read
+        # above over any checkout that decremented it since.
+        new, changed = [], defaultdict(list)
+        for (product_id, package_type), fields in wanted.items():
+            option = existing.get((product_id, package_type))
+            if option is None:
+                new.append(ProductOption(product_id=product_id, package_type=package_type, **fields))
+                continue
+            if any(getattr(option, field) != value for field, value in fields.items()):
+                for field, value in fields.items():
+                    setattr(option, field, value)
+                changed[tuple(fields)].append(option)
+        if new:
+            ProductOption.objects.bulk_create(new)
+        for fields, options in changed.items():
+            ProductOption.objects.bulk_update(options, fields)
+        self.counts['options_created'] += len(new)
+        self.counts['options_updated'] += sum(len(options) for options in changed.values())
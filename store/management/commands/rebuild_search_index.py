@@ -0,0 +1,17 @@
+# Rebuild the product search index from scratch, e.g. after bulk imports or
+# restoring a database backup.
+# Usage: python manage.py rebuild_search_index
+
+from django.core.management.base import BaseCommand
+from store import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index'
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stdout.write('Search index not available on this database; searches use icontains lookups')
+            return
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} products'))
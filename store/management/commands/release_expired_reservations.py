@@ -0,0 +1,17 @@
+# Return expired cart stock holds to stock. Run it every minute or so from
+# cron when CART_RESERVATION_SECONDS is set.
+# Usage: python manage.py release_expired_reservations
+
+from django.core.management.base import BaseCommand
+from store.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Release expired cart stock reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations'))
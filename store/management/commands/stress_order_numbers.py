@@ -0,0 +1,79 @@
+# Concurrency check for the order number allocator: several worker processes
+# create orders at the same time and the command verifies that every order
+# got a distinct number.
+# Usage: python manage.py stress_order_numbers --workers 8 --orders 500
+
+import multiprocessing
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, connections
+from store.models import Order
+
+STRESS_USERNAME = 'stress-order-numbers'
+
+
+def _create_orders(user_id, count, results):
+    collisions = 0
+    for _ in range(count):
+        while True:
+            try:
+                # A placeholder QR keeps the background renderer out of the run
+                Order.objects.create(user_id=user_id, total_amount=0, qr_code='qr_codes/stress.png')
+                break
+            except IntegrityError:
+                collisions += 1
+                break
+            except OperationalError:
+                # SQLite busy; the number drawn for this attempt becomes a gap
+                time.sleep(0.01)
+    connections.close_all()
+    results.put(collisions)
+
+
+class Command(BaseCommand):
+    help = 'Create orders from parallel processes and check order numbers never collide'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=500, help='Orders per worker')
+        parser.add_argument('--keep', action='store_true', help='Keep the created orders')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        per_worker = options['orders']
+        user, created = User.objects.get_or_create(username=STRESS_USERNAME)
+        Order.objects.filter(user=user).delete()
+
+        # Children must open their own connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=_create_orders, args=(user.id, per_worker, results))
+            for _ in range(workers)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        collisions = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        orders = Order.objects.filter(user=user)
+        total = orders.count()
+        distinct = orders.values('order_number').distinct().count()
+        expected = workers * per_worker
+        self.stdout.write(
+            f'{total} orders from {workers} workers in {elapsed:.2f}s '
+            f'({total / elapsed:.0f} orders/s), {distinct} distinct numbers, {collisions} collisions'
+        )
+        if not options['keep']:
+            orders.delete()
+            user.delete()
+
+        if collisions or total != expected or distinct != total:
+            raise CommandError('Order number allocation produced collisions or lost orders')
+        self.stdout.write(self.style.SUCCESS('No collisions'))
@@ -0,0 +1,55 @@
+# Pre-render every active product card, and the first page of every home
+# page tab, in every configured language, so the first visitors after a
+# deploy are not the ones paying for rendering. Starts a new fragment
+# generation first, so fragments rendered with the previous templates are
+# never served again; --keep only fills in what is missing. Only useful with
+# a shared cache backend: a LocMemCache dies with this command.
+# Usage: python manage.py warm_fragment_cache [--languages th en] [--keep]
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from store.catalog import CATEGORY_TYPES, MAX_TAB_PAGE_SIZE, build_product_page, get_catalog_snapshot
+from store.fragments import invalidate_fragments, render_cards, render_tab
+
+
+class Command(BaseCommand):
+    help = 'Render product card and tab fragments into the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--languages', nargs='+', help='Defaults to LANGUAGES, or LANGUAGE_CODE if unset')
+        parser.add_argument('--keep', action='store_true', help='Keep the current fragment generation')
+
+    def handle(self, *args, **options):
+        languages = options['languages']
+        if not languages:
+            # Django's default LANGUAGES lists every language it ships
+            languages = [code for code, name in settings.LANGUAGES] if settings.is_overridden('LANGUAGES') else [settings.LANGUAGE_CODE]
+        if not options['keep']:
+            invalidate_fragments()
+
+        started = time.perf_counter()
+        cards = 0
+        for category_type in CATEGORY_TYPES:
+            cursor = None
+            while True:
+                page = build_product_page(category_type, cursor, MAX_TAB_PAGE_SIZE)
+                for language in languages:
+                    render_cards(page['products'], language)
+                cards += len(page['products'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            self.stdout.write(f'{category_type}: {cards} cards so far')
+
+        snapshot = get_catalog_snapshot()
+        for language in languages:
+            for category_type in CATEGORY_TYPES:
+                render_tab(snapshot['tabs'][category_type]['products'], language)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {cards} cards and {len(CATEGORY_TYPES)} tabs in {len(languages)} "
+            f"language{'s' if len(languages) != 1 else ''} ({', '.join(languages)}) in {elapsed:.1f}s"
+        ))
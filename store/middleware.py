@@ -0,0 +1,271 @@
+# store/middleware.py
+# Per-view request instrumentation. A sample of requests is timed and every
+# SQL statement they run is fingerprinted, so statements repeated within one
+# request (usually an N+1 loop) show up per view. Figures are aggregated into
+# fixed-bucket histograms in this process only; each worker keeps its own.
+# ReplicaRoutingMiddleware keeps users who just wrote on the primary database.
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .routers import PIN_COOKIE, routing_state
+
+# Upper bounds in milliseconds; the last bucket is open-ended
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, float('inf'))
+
+# Distinct statements kept per view; the least frequent ones are dropped
+MAX_FINGERPRINTS = 50
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """SQL with literals and IN-list lengths removed"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _bucket(buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+
+
+def histogram_percentile(buckets, counts, fraction):
+    """Upper bound of the bucket holding the given fraction of samples"""
+    target = fraction * sum(counts)
+    seen = 0
+    for bound, count in zip(buckets, counts):
+        seen += count
+        if count and seen >= target:
+            return bound
+    return 0
+
+
+class ViewStats:
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.total_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.latency = [0] * len(LATENCY_BUCKETS)
+        self.query_counts = [0] * len(QUERY_BUCKETS)
+        # fingerprint -> [executions, repeats beyond the first per request, ms]
+        self.statements = {}
+
+    def add(self, elapsed_ms, executed):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.latency[_bucket(LATENCY_BUCKETS, elapsed_ms)] += 1
+        self.queries += len(executed)
+        self.max_queries = max(self.max_queries, len(executed))
+        self.query_counts[_bucket(QUERY_BUCKETS, len(executed))] += 1
+
+        per_request = {}
+        for sql, duration_ms in executed:
+            self.db_ms += duration_ms
+            entry = per_request.setdefault(fingerprint(sql), [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration_ms
+        for key, (count, duration_ms) in per_request.items():
+            statement = self.statements.get(key)
+            if statement is None:
+                if len(self.statements) >= MAX_FINGERPRINTS:
+                    coldest = min(self.statements, key=lambda k: self.statements[k][0])
+                    del self.statements[coldest]
+                statement = self.statements[key] = [0, 0, 0.0]
+            statement[0] += count
+            statement[1] += count - 1
+            statement[2] += duration_ms
+
+    def summary(self, statement_limit=5):
+        requests = self.requests or 1
+        statements = sorted(self.statements.items(), key=lambda item: (item[1][1], item[1][2]), reverse=True)
+        return {
+            'name': self.name,
+            'requests': self.requests,
+            'avg_ms': self.total_ms / requests,
+            'p50_ms': histogram_percentile(LATENCY_BUCKETS, self.latency, 0.5),
+            'p95_ms': histogram_percentile(LATENCY_BUCKETS, self.latency, 0.95),
+            'avg_queries': self.queries / requests,
+            'p95_queries': histogram_percentile(QUERY_BUCKETS, self.query_counts, 0.95),
+            'max_queries': self.max_queries,
+            'avg_db_ms': self.db_ms / requests,
+            'total_db_ms': self.db_ms,
+            'statements': [
+                {
+                    'sql': sql,
+                    'executions': executions,
+                    'per_request': executions / requests,
+                    'repeats': repeats,
+                    'total_ms': duration_ms,
+                }
+                for sql, (executions, repeats, duration_ms) in statements[:statement_limit]
+            ],
+        }
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.started_at = time.time()
+
+    def record(self, view_name, elapsed_ms, executed):
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = ViewStats(view_name)
+            stats.add(elapsed_ms, executed)
+
+    def hottest(self, limit=20, statement_limit=5):
+        """Views ordered by the total database time they caused"""
+        with self._lock:
+            summaries = [stats.summary(statement_limit) for stats in self._views.values()]
+        summaries.sort(key=lambda summary: summary['total_db_ms'], reverse=True)
+        return summaries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self.started_at = time.time()
+
+
+query_stats = QueryStats()
+
+
+class _Collector:
+    def __init__(self):
+        self.executed = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.executed.append((sql, (time.perf_counter() - started) * 1000))
+
+
+# Collector of the sampled request being served, if any. A context variable
+# rather than a per-connection wrapper so queries an async view runs on
+# worker threads, each with its own connection, are counted too.
+_collector = ContextVar('query_stats_collector', default=None)
+
+
+def _dispatch(execute, sql, params, many, context):
+    collector = _collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _instrument(sender, connection, **kwargs):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+class QueryStatsMiddleware:
+    """Record latency, query count and repeated statements per URL name.
+
+    Only QUERY_STATS_SAMPLE_RATE of requests are instrumented; the rest pass
+    straight through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_STATS_SAMPLE_RATE', 0.1)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _start(self):
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            _instrument(None, connection)
+        collector = _Collector()
+        return collector, _collector.set(collector), time.perf_counter()
+
+    def _finish(self, request, collector, token, started):
+        _collector.reset(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match is not None else '<unresolved>'
+        query_stats.record(view_name, elapsed_ms, collector.executed)
+
+    def _sampled(self):
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        collector, token, started = self._start()
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, collector, token, started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        collector, token, started = self._start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, collector, token, started)
+
+
+class ReplicaRoutingMiddleware:
+    """Pin a browser to the primary database for a while after it writes.
+
+    See store.routers; the pin is a short-lived cookie, so it costs no
+    lookups and follows the user rather than the worker process.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _pin(self, state, response):
+        if state.wrote and self.sticky_seconds:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with routing_state(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        with routing_state(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = await self.get_response(request)
+        return self._pin(state, response)
@@ -1,10 +1,13 @@
 ## store/models.py
 ```python
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
 import qrcode
 from io import BytesIO
+from decimal import Decimal
 from django.core.files import File
 from PIL import Image
 
@@ -32,6 +35,10 @@ class Product(models.Model):
     points = models.IntegerField(default=5)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        # Storefront tabs page through products in (name, id) order
+        indexes = [models.Index(fields=['name', 'id'])]
+    
     def __str__(self):
         return self.name
 
@@ -89,6 +96,17 @@ class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0)
+    
+    def mark_changed(self):
+        # Called after any change to the cart's items; cached summaries are
+        # keyed by version so this is all the invalidation they need
+        Cart.objects.filter(pk=self.pk).update(version=models.F('version') + 1, updated_at=timezone.now())
+        self.version += 1
+        self._summary = None
+        
+        from .inventory import sync_cart_reservations
+        sync_cart_reservations(self)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -98,6 +116,17 @@ class CartItem(models.Model):
     def get_total_price(self):
         return self.product_option.price * self.quantity
 
+class StockReservation(models.Model):
+    # Stock held for a cart; the quantity is already taken out of
+    # ProductOption.stock_quantity until the hold is used or expires
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product_option = models.ForeignKey(ProductOption, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = [('cart', 'product_option')]
+
 class Order(models.Model):
     ORDER_STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -116,24 +145,46 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     qr_code = models.ImageField(upload_to='qr_codes/', blank=True)
     
+    class Meta:
+        # Exports and the admin select orders by creation date
+        indexes = [models.Index(fields=['created_at'])]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the sales rollups currently count this order as
+        instance._rollup_state = (instance.__dict__.get('status'), instance.__dict__.get('total_amount'))
+        return instance
+    
     def save(self, *args, **kwargs):
+        creating = self._state.adding
         if not self.order_number:
-            self.order_number = f"ORD{timezone.now().strftime('%Y%m%d%H%M%S')}"
+            from .sequences import allocate_order_number
+            self.order_number = allocate_order_number()
         super().save(*args, **kwargs)
         
-        # Generate QR code
-        if not self.qr_code:
-            qr_data = f"Order: {self.order_number}\nAmount: {self.total_amount} THB\nDate: {self.created_at.strftime('%Y-%m-%d %H:%M')}"
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            qr_image = qr.make_image(fill_color="black", back_color="white")
-            buffer = BytesIO()
-            qr_image.save(buffer, format='PNG')
-            file_name = f'qr_{self.order_number}.png'
-            self.qr_code.save(file_name, File(buffer), save=False)
-            super().save(*args, **kwargs)
+        # QR code is rendered by a background worker once the order commits
+        if creating and not self.qr_code:
+            from .tasks import enqueue_order_qr_code
+            enqueue_order_qr_code(self.pk)
+    
+    def generate_qr_code(self):
+        qr_data = f"Order: {self.order_number}\nAmount: {self.total_amount} THB\nDate: {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+        qr = qrcode.QRCode(version=1, box_size=10, border=5)
+        qr.add_data(qr_data)
+        qr.make(fit=True)
+        
+        qr_image = qr.make_image(fill_color="black", back_color="white")
+        buffer = BytesIO()
+        qr_image.save(buffer, format='PNG')
+        file_name = f'qr_{self.order_number}.png'
+        self.qr_code.save(file_name, File(buffer), save=False)
+        # Only touch the qr_code column so a concurrent status change is kept,
+        # and only if it is still empty: the payment page and the background
+        # worker can both get here, and the first one to finish wins
+        if not Order.objects.filter(pk=self.pk, qr_code='').update(qr_code=self.qr_code.name):
+            self.qr_code.storage.delete(self.qr_code.name)
+            self.qr_code = Order.objects.filter(pk=self.pk).values_list('qr_code', flat=True).get()
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -144,13 +195,50 @@ class OrderItem(models.Model):
     def get_total_price(self):
         return self.price * self.quantity
 
+class DailySalesRollup(models.Model):
+    # Orders and revenue per creation day and current status, kept up to
+    # date by store.rollups
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = [('date', 'status')]
+    
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.order_count} orders"
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.IntegerField(default=0)
+    order_lines = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = [('date', 'product')]
+    
+    def __str__(self):
+        return f"{self.date} {self.product_id}: {self.units} units"
+
+class NumberSequence(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name} ({self.next_value})"
+
 class SiteSettings(models.Model):
+    # Defaults used when no SiteSettings row has been saved yet
+    DEFAULT_POINTS_TO_CURRENCY_RATE = Decimal('0.10')  # 100 points = 10 baht
+    DEFAULT_REFERRAL_POINTS = 50
+    
     company_name = models.CharField(max_length=200, default="Fresh Market")
     bank_account_name = models.CharField(max_length=200)
     bank_account_number = models.CharField(max_length=50)
     bank_name = models.CharField(max_length=100)
-    points_to_currency_rate = models.DecimalField(max_digits=10, decimal_places=2, default=0.10)  # 100 points = 10 baht
-    referral_points = models.IntegerField(default=50)
+    points_to_currency_rate = models.DecimalField(max_digits=10, decimal_places=2, default=DEFAULT_POINTS_TO_CURRENCY_RATE)
+    referral_points = models.IntegerField(default=DEFAULT_REFERRAL_POINTS)
     
     class Meta:
         verbose_name = "Site Settings"
@@ -158,3 +246,94 @@ class SiteSettings(models.Model):
     
     def __str__(self):
         return self.company_name
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductOption)
+@receiver(post_delete, sender=ProductOption)
+@receiver(post_save, sender=CarouselImage)
+@receiver(post_delete, sender=CarouselImage)
+def invalidate_catalog(sender, **kwargs):
+    from .catalog import invalidate_catalog_snapshot
+    transaction.on_commit(invalidate_catalog_snapshot)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductOption)
+@receiver(post_delete, sender=ProductOption)
+@receiver(post_save, sender=ProductPromotion)
+@receiver(post_delete, sender=ProductPromotion)
+def invalidate_product_fragments(sender, instance, **kwargs):
+    from .fragments import invalidate_product_fragments
+    product_id = instance.pk if sender is Product else instance.product_id
+    transaction.on_commit(lambda: invalidate_product_fragments([product_id]))
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_search_index(sender, instance, **kwargs):
+    from .search import schedule_index
+    schedule_index([instance.pk])
+
+@receiver(post_save, sender=Category)
+def update_category_search_index(sender, instance, created, **kwargs):
+    # The category name is indexed with each of its products
+    if not created:
+        from .search import schedule_index
+        schedule_index(Product.objects.filter(category=instance).values_list('id', flat=True))
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=CarouselImage)
+def create_image_variants(sender, instance, **kwargs):
+    from .images import has_variants
+    from .tasks import enqueue_image_variants
+    if instance.image and not has_variants(instance.image.name):
+        enqueue_image_variants(instance.image.name)
+
+@receiver(post_save, sender=ProductPromotion)
+@receiver(post_delete, sender=ProductPromotion)
+def refresh_product_promotions(sender, instance, **kwargs):
+    from .promotions import refresh_promotions
+    refresh_promotions([instance.product_id])
+
+@receiver(post_save, sender=Promotion)
+def refresh_promotion(sender, instance, **kwargs):
+    from .promotions import refresh_promotions
+    refresh_promotions(ProductPromotion.objects.filter(promotion=instance).values_list('product_id', flat=True))
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def invalidate_site_settings(sender, **kwargs):
+    from .site_settings import invalidate_site_settings
+    transaction.on_commit(invalidate_site_settings)
+
+@receiver(post_save, sender=Order)
+def rollup_order(sender, instance, created, **kwargs):
+    from .rollups import record_order, record_order_change
+    if created:
+        record_order(instance)
+    else:
+        record_order_change(instance)
+    instance._rollup_state = (instance.status, instance.total_amount)
+
+@receiver(post_delete, sender=Order)
+def rollup_order_delete(sender, instance, **kwargs):
+    from .rollups import record_order
+    record_order(instance, sign=-1)
+
+@receiver(post_save, sender=OrderItem)
+def rollup_order_item(sender, instance, created, **kwargs):
+    from .rollups import record_order_items
+    if created:
+        record_order_items(instance.order, [instance])
+
+@receiver(post_delete, sender=OrderItem)
+def rollup_order_item_delete(sender, instance, **kwargs):
+    from .rollups import record_order_items
+    record_order_items(instance.order, [instance], sign=-1)
+
+@receiver(pre_delete, sender=Cart)
+def release_cart_stock(sender, instance, **kwargs):
+    from .inventory import release_cart_reservations
+    release_cart_reservations(instance)
@@ -0,0 +1,171 @@
+# store/promotions.py
+# In-memory promotion resolver. Every product's promotions are flattened into
+# a sorted list of non-overlapping time segments, so finding the promotion in
+# effect at a given instant is a binary search and never a query.
+import threading
+from bisect import bisect_right, insort
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ProductPromotion
+from .versioning import bump_version, get_version
+
+PROMOTIONS_VERSION = 'promotions'
+
+# end_date is inclusive; segments are stored half-open
+_END_PADDING = timedelta(microseconds=1)
+
+Promo = namedtuple('Promo', ['price', 'tag', 'promotion_id'])
+_Entry = namedtuple('_Entry', ['start', 'end', 'promo'])
+
+
+def _build_segments(entries):
+    """Flatten possibly overlapping entries into ``(starts, segments)``"""
+    points = sorted({entry.start for entry in entries} | {entry.end for entry in entries})
+    starts, segments = [], []
+    for start, end in zip(points, points[1:]):
+        covering = [entry.promo for entry in entries if entry.start <= start and entry.end >= end]
+        if not covering:
+            continue
+        # When promotions overlap the cheapest price wins
+        promo = min(covering, key=lambda promo: promo.price)
+        if segments and segments[-1][1] == start and segments[-1][2] == promo:
+            segments[-1] = (segments[-1][0], end, promo)
+        else:
+            starts.append(start)
+            segments.append((start, end, promo))
+    return starts, segments
+
+
+class PromotionIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._products = {}
+        self._boundaries = []
+
+    def _entries(self, product_ids=None):
+        rows = ProductPromotion.objects.filter(promotion__is_active=True)
+        if product_ids is not None:
+            rows = rows.filter(product_id__in=product_ids)
+        rows = rows.values_list(
+            'product_id', 'promotional_price', 'promotion_id',
+            'promotion__tag_text', 'promotion__start_date', 'promotion__end_date'
+        )
+        entries = defaultdict(list)
+        for product_id, price, promotion_id, tag, start, end in rows:
+            entries[product_id].append(_Entry(start, end + _END_PADDING, Promo(price, tag, promotion_id)))
+        return entries
+
+    def _set_product(self, product_id, entries):
+        old = self._products.pop(product_id, None)
+        if old is not None:
+            for start, end, promo in old[1]:
+                self._boundaries.remove(start)
+                self._boundaries.remove(end)
+        if entries:
+            starts, segments = _build_segments(entries)
+            self._products[product_id] = (starts, segments)
+            for start, end, promo in segments:
+                insort(self._boundaries, start)
+                insort(self._boundaries, end)
+
+    def _reload(self, version):
+        self._products = {}
+        self._boundaries = []
+        for product_id, entries in self._entries().items():
+            self._set_product(product_id, entries)
+        self._version = version
+
+    def _ensure_current(self):
+        version = get_version(PROMOTIONS_VERSION)
+        if version != self._version:
+            self._reload(version)
+
+    def refresh_products(self, product_ids):
+        """Rebuild the given products after their promotions changed"""
+        with self._lock:
+            product_ids = set(product_ids)
+            entries = self._entries(product_ids)
+            previous = self._version
+            for product_id in product_ids:
+                self._set_product(product_id, entries.get(product_id))
+            version = bump_version(PROMOTIONS_VERSION)
+            # Anything else bumped in between means other workers changed
+            # promotions too; pick those up with a full reload next time
+            self._version = version if previous is not None and version == previous + 1 else None
+
+    def resolve(self, product_ids, at=None):
+        """Map each product id with a promotion in effect at ``at`` to its Promo"""
+        at = at or timezone.now()
+        resolved = {}
+        with self._lock:
+            self._ensure_current()
+            for product_id in product_ids:
+                indexed = self._products.get(product_id)
+                if indexed is None:
+                    continue
+                starts, segments = indexed
+                position = bisect_right(starts, at) - 1
+                if position >= 0 and at < segments[position][1]:
+                    resolved[product_id] = segments[position][2]
+        return resolved
+
+    def next_boundary(self, after=None):
+        """Earliest moment after ``after`` when any product's promotion changes"""
+        after = after or timezone.now()
+        with self._lock:
+            self._ensure_current()
+            position = bisect_right(self._boundaries, after)
+            if position < len(self._boundaries):
+                return self._boundaries[position]
+        return None
+
+
+promotion_index = PromotionIndex()
+
+
+def refresh_promotions(product_ids):
+    from .catalog import invalidate_catalog_snapshot
+    product_ids = list(product_ids)
+
+    def refresh():
+        promotion_index.refresh_products(product_ids)
+        # The catalog snapshot embeds promotion prices, so rebuild it after
+        # the index has the new data
+        invalidate_catalog_snapshot()
+
+    # Other workers must not reload before the change is visible to them
+    transaction.on_commit(refresh)
+
+
+def promotional_price(price, base_price, promo):
+    """Option price under ``promo``.
+
+    A promotion carries one promotional price per product, which is read as
+    the price of ``base_price``; every package option is discounted by the
+    same ratio.
+    """
+    if promo is None:
+        return price
+    if not base_price:
+        return promo.price
+    return (price * promo.price / base_price).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def price_cart_items(cart_items, at=None):
+    """Set ``unit_price``, ``total_price`` and ``promotion`` on each cart item.
+
+    Items should be loaded with ``select_related('product_option__product')``.
+    """
+    promotions = promotion_index.resolve({item.product_option.product_id for item in cart_items}, at)
+    for item in cart_items:
+        option = item.product_option
+        item.promotion = promotions.get(option.product_id)
+        item.unit_price = promotional_price(option.price, option.product.base_price, item.promotion)
+        item.total_price = item.unit_price * item.quantity
+    return cart_items
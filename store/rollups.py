@@ -0,0 +1,96 @@
+# store/rollups.py
+# Daily sales rollups read by the admin dashboard. Rows are adjusted with
+# F() increments as orders are created, change status or are deleted, so the
+# dashboard never has to aggregate over the full order history.
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DailySalesRollup, DailyProductSales
+
+
+def order_date(order):
+    created_at = order.created_at
+    if timezone.is_aware(created_at):
+        created_at = timezone.localtime(created_at)
+    return created_at.date()
+
+
+def _increment(model, lookup, deltas):
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Created concurrently; the row exists now
+        model.objects.filter(**lookup).update(**updates)
+
+
+def add_sales(date, status, orders, revenue):
+    _increment(DailySalesRollup, {'date': date, 'status': status}, {'order_count': orders, 'revenue': revenue})
+
+
+def add_product_sales(date, totals):
+    """Add ``{product_id: (units, order_lines)}`` to the rows for ``date``.
+
+    Costs a fixed number of queries however many products are involved.
+    """
+    if not totals:
+        return
+    existing = {
+        row.product_id: row
+        for row in DailyProductSales.objects.filter(date=date, product_id__in=totals).only('id', 'product_id')
+    }
+    for product_id, row in existing.items():
+        units, lines = totals[product_id]
+        row.units = F('units') + units
+        row.order_lines = F('order_lines') + lines
+    if existing:
+        DailyProductSales.objects.bulk_update(existing.values(), ['units', 'order_lines'])
+
+    missing = [product_id for product_id in totals if product_id not in existing]
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            DailyProductSales.objects.bulk_create([
+                DailyProductSales(date=date, product_id=product_id, units=totals[product_id][0], order_lines=totals[product_id][1])
+                for product_id in missing
+            ])
+    except IntegrityError:
+        for product_id in missing:
+            units, lines = totals[product_id]
+            _increment(DailyProductSales, {'date': date, 'product_id': product_id}, {'units': units, 'order_lines': lines})
+
+
+def record_order(order, sign=1):
+    status, total = order.status, order.total_amount
+    if sign < 0:
+        # Remove what was counted, not whatever is unsaved on the instance
+        status, total = getattr(order, '_rollup_state', (status, total))
+    add_sales(order_date(order), status, sign, sign * total)
+
+
+def record_order_change(order):
+    """Move an existing order to its new status/amount in the rollups"""
+    previous_status, previous_total = getattr(order, '_rollup_state', (None, None))
+    if previous_status is None:
+        return
+    if previous_status == order.status and previous_total == order.total_amount:
+        return
+    date = order_date(order)
+    add_sales(date, previous_status, -1, -previous_total)
+    add_sales(date, order.status, 1, order.total_amount)
+
+
+def record_order_items(order, items, sign=1):
+    """Count ``items`` towards product sales; items need ``product_option`` loaded"""
+    totals = defaultdict(lambda: (0, 0))
+    for item in items:
+        units, lines = totals[item.product_option.product_id]
+        totals[item.product_option.product_id] = (units + sign * item.quantity, lines + sign)
+    add_product_sales(order_date(order), totals)
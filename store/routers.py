@@ -0,0 +1,121 @@
+# store/routers.py
+# Read replica routing. Views marked with @use_replica read catalog and
+# reporting models from one of READ_REPLICAS; everything else, all writes
+# and any read inside a transaction go to the primary. Once a request writes,
+# ReplicaRoutingMiddleware pins that browser to the primary for
+# REPLICA_STICKY_SECONDS, so users always read their own writes even if the
+# replicas lag behind.
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models that may be read from a replica inside a @use_replica view
+REPLICA_MODELS = {
+    'store.Category',
+    'store.Product',
+    'store.ProductOption',
+    'store.CarouselImage',
+    'store.Order',
+    'store.OrderItem',
+    'store.DailySalesRollup',
+    'store.DailyProductSales',
+    'accounts.ReferralClosure',
+}
+
+PIN_COOKIE = 'db_primary'
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+
+
+# None outside requests (management commands, background tasks)
+_state = ContextVar('db_routing_state', default=None)
+
+
+@contextmanager
+def routing_state(pinned=False):
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def _replica_reads(enabled):
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    previous = state.replica_reads
+    state.replica_reads = enabled
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+
+
+def primary_reads():
+    """Read from the primary inside a @use_replica view.
+
+    For results that get cached: a lagging replica would otherwise be
+    frozen into the cache until the next invalidation.
+    """
+    return _replica_reads(False)
+
+
+def use_replica(view):
+    """Let ``view`` (sync or async) read catalog and reporting models from a replica"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with _replica_reads(True):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with _replica_reads(True):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def read_replicas():
+    return getattr(settings, 'READ_REPLICAS', [])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or state.pinned:
+            return None
+        if model._meta.label not in REPLICA_MODELS:
+            return None
+        replicas = read_replicas()
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Later reads in this request see the write too
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in read_replicas()
@@ -0,0 +1,236 @@
+# store/search.py
+# Product search. On SQLite the index is an FTS5 table with the trigram
+# tokenizer, keyed by product id and kept in step with Product and Category
+# saves. Any substring of three or more characters matches, which gives
+# prefix search, and a misspelt word still shares most of its trigrams with
+# the right one, which gives typo tolerance: candidates are fetched by OR-ing
+# the query's trigrams and ranked by how many of them they contain. Every
+# candidate is scored, streamed from the cursor, so totals and facets count
+# all matches while only the best ``limit`` are kept.
+# Words shorter than three characters have no trigrams; they must appear in
+# the product name instead. Other databases fall back to icontains lookups.
+import heapq
+import re
+import threading
+from collections import Counter, namedtuple
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Q
+
+from .models import Category, Product
+
+TABLE = 'store_product_search'
+FETCH_SIZE = 1000
+# Admin search filters the changelist by id; past this many matches it falls
+# back to the ORM search instead of passing a huge id list
+ADMIN_ID_LIMIT = 5000
+# Share of the query's trigrams a product must contain to count as a match
+MIN_SIMILARITY = 0.5
+
+Hit = namedtuple('Hit', ['product_id', 'score'])
+SearchResult = namedtuple('SearchResult', ['hits', 'facets', 'total'])
+_Match = namedtuple('_Match', ['product_id', 'score', 'name', 'category_id', 'category_name'])
+
+_WORD = re.compile(r'\w+')
+_lock = threading.Lock()
+_ready = None
+
+
+def _trigrams(text):
+    grams = set()
+    for word in _WORD.findall(text.lower()):
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def _short_words(text):
+    return [word for word in _WORD.findall(text.lower()) if len(word) < 3]
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def available():
+    """Whether the FTS5 index can be used on this database"""
+    global _ready
+    if _ready is not None:
+        return _ready
+    with _lock:
+        if _ready is not None:
+            return _ready
+        ready = connection.vendor == 'sqlite' and _create_index()
+        # A table created inside a transaction is gone again if it rolls back
+        if not connection.in_atomic_block:
+            _ready = ready
+    return ready
+
+
+def _create_index():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+            if cursor.fetchone():
+                return True
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {TABLE} USING fts5(name, description, category, tokenize='trigram')"
+            )
+    except DatabaseError:
+        # SQLite built without FTS5 or too old for the trigram tokenizer
+        return False
+    _rebuild()
+    return True
+
+
+def rebuild_index(chunk_size=2000):
+    """Reindex every product; returns how many were indexed"""
+    if not available():
+        return 0
+    return _rebuild(chunk_size)
+
+
+def _rebuild(chunk_size=2000):
+    indexed = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        rows = Product.objects.values_list('id', 'name', 'description', 'category__name').order_by('id')
+        batch = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                _insert(cursor, batch)
+                indexed += len(batch)
+                batch = []
+        _insert(cursor, batch)
+        indexed += len(batch)
+    return indexed
+
+
+def _insert(cursor, rows):
+    if rows:
+        cursor.executemany(f'INSERT INTO {TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)', rows)
+
+
+def index_products(product_ids):
+    """Bring the index entries for ``product_ids`` up to date"""
+    product_ids = list(product_ids)
+    if not product_ids or not available():
+        return
+    rows = list(Product.objects.filter(pk__in=product_ids).values_list('id', 'name', 'description', 'category__name'))
+    with transaction.atomic(), connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', product_ids)
+        _insert(cursor, rows)
+
+
+def schedule_index(product_ids):
+    # After commit, so the index never holds rows that rolled back
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: index_products(product_ids))
+
+
+def _matches(query, active_only=True):
+    """Yield a ``_Match`` for every product matching ``query``, in no particular order"""
+    grams = _trigrams(query)
+    if not grams:
+        return
+    sql = (
+        f'SELECT p.id, p.name, p.description, p.category_id, c.name FROM {TABLE} s '
+        f'JOIN {Product._meta.db_table} p ON p.id = s.rowid '
+        f'JOIN {Category._meta.db_table} c ON c.id = p.category_id '
+        f'WHERE s.{TABLE} MATCH %s {"AND p.is_active" if active_only else ""}'
+    )
+    needle = query.lower()
+    short_words = _short_words(query)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [' OR '.join(_quote(gram) for gram in sorted(grams))])
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for product_id, name, description, category_id, category_name in rows:
+                lowered = name.lower()
+                if not all(word in lowered for word in short_words):
+                    continue
+                score = len(grams & _trigrams(f'{lowered} {category_name}')) / len(grams)
+                if lowered.startswith(needle):
+                    score += 1
+                elif needle in lowered:
+                    score += 0.5
+                elif needle in description.lower():
+                    score = max(score, MIN_SIMILARITY)
+                if score >= MIN_SIMILARITY:
+                    yield _Match(product_id, score, lowered, category_id, category_name)
+
+
+def search(query, category_id=None, limit=20, active_only=True):
+    """Products matching ``query``, best first, with category facets.
+
+    Facets are ``[(category_id, category_name, count)]`` over all matches
+    before the category filter is applied; ``total`` counts all matches
+    after it.
+    """
+    query = query.strip()
+    if not query:
+        return SearchResult([], [], 0)
+
+    if not available() or len(query) < 3:
+        return _fallback_search(_text_condition(query), category_id, limit, active_only)
+    if not _trigrams(query):
+        # Only short words, e.g. "5 kg"
+        return _fallback_search(_name_condition(_short_words(query)), category_id, limit, active_only)
+
+    facets = Counter()
+    total = 0
+
+    def counted(matches):
+        nonlocal total
+        for match in matches:
+            facets[match.category_id, match.category_name] += 1
+            if category_id is None or match.category_id == category_id:
+                total += 1
+                yield match
+
+    best = heapq.nsmallest(limit, counted(_matches(query, active_only)), key=lambda match: (-match.score, match.name, match.product_id))
+    return SearchResult(
+        [Hit(match.product_id, round(match.score, 3)) for match in best],
+        [(facet_id, name, count) for (facet_id, name), count in facets.most_common()],
+        total,
+    )
+
+
+def search_ids(query):
+    """Ids of all matching products for admin search; None to use the ORM search instead"""
+    if not available() or not _trigrams(query):
+        return None
+    product_ids = []
+    for match in _matches(query.strip(), active_only=False):
+        product_ids.append(match.product_id)
+        if len(product_ids) > ADMIN_ID_LIMIT:
+            return None
+    return product_ids
+
+
+def _text_condition(query):
+    return Q(name__icontains=query) | Q(description__icontains=query) | Q(category__name__icontains=query)
+
+
+def _name_condition(words):
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word)
+    return condition
+
+
+def _fallback_search(condition, category_id, limit, active_only):
+    products = Product.objects.filter(is_active=True) if active_only else Product.objects.all()
+    products = products.filter(condition)
+    facets = [
+        (row['category'], row['category__name'], row['count'])
+        for row in products.values('category', 'category__name').annotate(count=Count('id')).order_by('-count')
+    ]
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+    hits = [Hit(product_id, 1.0) for product_id in products.order_by('name', 'id').values_list('id', flat=True)[:limit]]
+    total = sum(count for facet_id, name, count in facets if category_id is None or facet_id == category_id)
+    return SearchResult(hits, facets, total)
@@ -0,0 +1,76 @@
+# store/sequences.py
+# Gap-tolerant number allocation. Each process reserves a block of numbers
+# with one UPDATE and then hands them out from memory, so allocating a number
+# normally costs no query at all.
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import NumberSequence
+
+
+class BlockAllocator:
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 0
+        self._end = 0
+
+    def _reserve(self, size):
+        """Claim ``size`` numbers and return the first one"""
+        with transaction.atomic():
+            updated = NumberSequence.objects.filter(name=self.name).update(
+                next_value=F('next_value') + size
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        NumberSequence.objects.create(name=self.name, next_value=1 + size)
+                    return 1
+                except IntegrityError:
+                    # Another process created the row first
+                    NumberSequence.objects.filter(name=self.name).update(
+                        next_value=F('next_value') + size
+                    )
+            end = NumberSequence.objects.filter(name=self.name).values_list('next_value', flat=True).get()
+        return end - size
+
+    def allocate(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked workers must not share the parent's block
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            if self._next < self._end:
+                value = self._next
+                self._next += 1
+                return value
+            if connection.in_atomic_block:
+                # If the caller's transaction rolls back the reservation goes
+                # with it, so never keep spare numbers from inside one
+                return self._reserve(1)
+            self._next = self._reserve(self.block_size)
+            self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+    def allocate_range(self, count):
+        """Claim ``count`` consecutive numbers with a single reservation"""
+        if count <= 0:
+            return range(0)
+        start = self._reserve(count)
+        return range(start, start + count)
+
+
+order_numbers = BlockAllocator('order_number', getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 50))
+
+
+def allocate_order_number():
+    return f"ORD{timezone.now().strftime('%Y%m%d')}{order_numbers.allocate():08d}"
@@ -0,0 +1,36 @@
+# store/site_settings.py
+# Process-wide SiteSettings. The row is loaded once per process and reloaded
+# after a save anywhere bumps the shared version stamp, or after
+# SITE_SETTINGS_MAX_AGE seconds in case a bump never reached this process
+# (a per-process cache backend, or an evicted stamp).
+import threading
+import time
+
+from .models import SiteSettings
+from .versioning import bump_version, get_version
+
+SITE_SETTINGS_VERSION = 'site_settings'
+SITE_SETTINGS_MAX_AGE = 60  # seconds
+
+_cached = None
+_lock = threading.Lock()
+
+
+def get_site_settings():
+    """The SiteSettings row, or an unsaved instance holding the defaults.
+
+    The instance is shared by the whole process; treat it as read-only.
+    """
+    global _cached
+    version = get_version(SITE_SETTINGS_VERSION)
+    cached = _cached
+    if cached is not None and cached[0] == version and time.monotonic() < cached[2]:
+        return cached[1]
+    with _lock:
+        settings = SiteSettings.objects.first() or SiteSettings()
+        _cached = (version, settings, time.monotonic() + SITE_SETTINGS_MAX_AGE)
+    return settings
+
+
+def invalidate_site_settings():
+    bump_version(SITE_SETTINGS_VERSION)
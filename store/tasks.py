@@ -0,0 +1,70 @@
+# store/tasks.py
+# In-process worker pool for work that should not hold up a request, such as
+# image encoding. Jobs are handed to the pool only after the surrounding
+# transaction commits, so workers always see the rows they were queued for.
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+                thread_name_prefix='store-tasks',
+            )
+    return _executor
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background task %s%r failed', func.__name__, args)
+    finally:
+        # Pool threads are long-lived; don't let them hold connections open
+        connections.close_all()
+
+
+def run_in_background(func, *args):
+    _get_executor().submit(_run, func, args)
+
+
+def run_after_commit(func, *args):
+    transaction.on_commit(lambda: run_in_background(func, *args))
+
+
+def generate_order_qr_code(order_id):
+    from .models import Order
+    order = Order.objects.filter(pk=order_id).first()
+    if order is not None and not order.qr_code:
+        order.generate_qr_code()
+
+
+def enqueue_order_qr_code(order_id):
+    run_after_commit(generate_order_qr_code, order_id)
+
+
+def generate_image_variants(name):
+    from .catalog import invalidate_catalog_snapshot
+    from .fragments import invalidate_product_fragments
+    from .images import render_variants
+    from .models import Product
+    if render_variants(name):
+        # Cached catalog pages and cards still point at the original
+        invalidate_catalog_snapshot()
+        invalidate_product_fragments(Product.objects.filter(image=name).values_list('id', flat=True))
+
+
+def enqueue_image_variants(name):
+    run_after_commit(generate_image_variants, name)
@@ -0,0 +1,21 @@
+# store/templatetags/image_variants.py
+# {% load image_variants %}
+# <picture>
+#     <source srcset="{{ product.image|webp_variant:'card' }}" type="image/webp">
+#     <img src="{{ product.image|variant:'card' }}" alt="{{ product.name }}">
+# </picture>
+from django import template
+
+from store.images import variant_url
+
+register = template.Library()
+
+
+@register.filter
+def variant(image, name):
+    return variant_url(image, name)
+
+
+@register.filter
+def webp_variant(image, name):
+    return variant_url(image, name, webp=True)
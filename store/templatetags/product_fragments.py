@@ -0,0 +1,23 @@
+# store/templatetags/product_fragments.py
+# Home page cards from the fragment cache (store/fragments.py), e.g. in
+# store/index.html:
+# {% load product_fragments %}
+# <div class="tab-pane fade show active" id="vegetables" role="tabpanel">
+#     {% product_tab vegetables %}
+# </div>
+# or card by card: {% for card in vegetables|product_cards %}{{ card }}{% endfor %}
+from django import template
+
+from store.fragments import render_cards, render_tab
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_tab(products):
+    return render_tab(products)
+
+
+@register.filter
+def product_cards(products):
+    return render_cards(products)
@@ -0,0 +1,567 @@
+# store/tests.py
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from io import StringIO
+import warnings
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from unittest import mock
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.cache.backends.base import CacheKeyWarning
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from .carts import get_cart_summary
+from .exports import filter_orders
+from .checkout import CheckoutError, place_order
+from .catalog import build_product_page, encode_cursor, get_catalog_snapshot
+from . import fragments
+from .fragments import render_cards, render_tab
+from .inventory import InsufficientStockError, release_expired_reservations, take_stock
+from .versioning import bump_version, get_version
+from .routers import PIN_COOKIE, routing_state, use_replica
+from .sequences import BlockAllocator, allocate_order_number
+from .models import (
+    CarouselImage, Cart, CartItem, Category, Order, OrderItem, Product, ProductOption,
+    ProductPromotion, Promotion, SiteSettings, StockReservation,
+)
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+_serial = count(1)
+
+
+def make_user():
+    n = next(_serial)
+    return User.objects.create_user(f'customer{n}', f'customer{n}@example.com', 'password')
+
+
+def make_category():
+    n = next(_serial)
+    return Category.objects.create(name=f'Category {n}', category_type='vegetable')
+
+
+def make_product():
+    n = next(_serial)
+    return Product.objects.create(
+        name=f'Product {n}', category=make_category(), description='Fresh',
+        image=f'products/product-{n}.jpg', base_price=Decimal('20.00'),
+    )
+
+
+def make_option(stock_quantity=10):
+    return ProductOption.objects.create(
+        product=make_product(), package_type='small', weight='500g', price=Decimal('25.00'),
+        stock_quantity=stock_quantity,
+    )
+
+
+def make_promotion():
+    n = next(_serial)
+    now = timezone.now()
+    return Promotion.objects.create(
+        name=f'Promotion {n}', discount_rate=Decimal('10.00'),
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+    )
+
+
+def make_product_promotion():
+    return ProductPromotion.objects.create(
+        product=make_product(), promotion=make_promotion(), promotional_price=Decimal('18.00'),
+    )
+
+
+def make_carousel_image():
+    n = next(_serial)
+    return CarouselImage.objects.create(title=f'Slide {n}', image=f'carousel/slide-{n}.jpg', order=n)
+
+
+def make_cart():
+    cart = Cart.objects.create(user=make_user())
+    for _ in range(2):
+        CartItem.objects.create(cart=cart, product_option=make_option(), quantity=2)
+    return cart
+
+
+def make_order():
+    order = Order.objects.create(user=make_user(), total_amount=Decimal('50.00'))
+    for _ in range(2):
+        OrderItem.objects.create(order=order, product_option=make_option(), quantity=1, price=Decimal('25.00'))
+    return order
+
+
+def make_site_settings():
+    n = next(_serial)
+    return SiteSettings.objects.create(
+        company_name=f'Market {n}', bank_account_name='Fresh Market', bank_account_number=f'000-{n}', bank_name='Bank',
+    )
+
+
+def run_in_threads(target, workers):
+    """Run ``target(worker)`` in ``workers`` threads at once and return the results"""
+    start = threading.Barrier(workers)
+
+    def run(worker):
+        try:
+            start.wait()
+            return target(worker)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, range(workers)))
+
+
+class StoreTestMixin:
+    """Runs against an empty per-process cache, with background jobs switched off"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Background jobs run on worker threads, outside the test's transaction
+        for target in ('store.tasks.run_in_background', 'accounts.codes.run_in_background'):
+            patcher = mock.patch(target)
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StoreTestCase(StoreTestMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StoreTransactionTestCase(StoreTestMixin, TransactionTestCase):
+    """For tests that write from several threads, each on its own connection"""
+
+
+class ChangelistQueriesTestCase(StoreTestCase):
+    """Admin changelists must not run queries per listed row"""
+    rows = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.superuser)
+
+    def get_changelist(self, url):
+        # Untimed first request so one-off lookups (sessions, caches) aren't counted
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(captured)
+
+    def assertChangelistQueriesConstant(self, model, make_row):
+        """Lists ``rows`` then 2 * ``rows`` rows made by ``make_row`` and expects the same query count"""
+        self.assertGreater(admin.site._registry[model].list_per_page, 2 * self.rows)
+        url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+
+        for _ in range(self.rows):
+            make_row()
+        response, queries = self.get_changelist(url)
+        listed = response.context['cl'].result_count
+
+        for _ in range(self.rows):
+            make_row()
+        self.client.get(url)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertGreater(response.context['cl'].result_count, listed)
+
+
+class StoreChangelistQueriesTests(ChangelistQueriesTestCase):
+
+    def test_category(self):
+        self.assertChangelistQueriesConstant(Category, make_category)
+
+    def test_product(self):
+        self.assertChangelistQueriesConstant(Product, make_product)
+
+    def test_product_option(self):
+        self.assertChangelistQueriesConstant(ProductOption, make_option)
+
+    def test_promotion(self):
+        self.assertChangelistQueriesConstant(Promotion, make_promotion)
+
+    def test_product_promotion(self):
+        self.assertChangelistQueriesConstant(ProductPromotion, make_product_promotion)
+
+    def test_carousel_image(self):
+        self.assertChangelistQueriesConstant(CarouselImage, make_carousel_image)
+
+    def test_cart(self):
+        self.assertChangelistQueriesConstant(Cart, make_cart)
+
+    def test_order(self):
+        self.assertChangelistQueriesConstant(Order, make_order)
+
+    def test_site_settings(self):
+        self.assertChangelistQueriesConstant(SiteSettings, make_site_settings)
+
+
+class CartSummaryTests(StoreTestCase):
+
+    def test_price_and_points_edits_show_up(self):
+        cart = make_cart()
+        option = cart.items.first().product_option
+        summary = get_cart_summary(Cart.objects.get(pk=cart.pk))
+        self.assertEqual(summary.subtotal, Decimal('100.00'))
+        self.assertEqual(summary.points, 20)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            option.price = Decimal('30.00')
+            option.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            option.product.points = 7
+            option.product.save()
+        summary = get_cart_summary(Cart.objects.get(pk=cart.pk))
+        self.assertEqual(summary.subtotal, Decimal('110.00'))
+        self.assertEqual(summary.points, 24)
+
+
+class ProductTabTests(StoreTestCase):
+
+    def test_cursor_cache_keys_stay_valid_for_memcached(self):
+        product = make_product()
+        product.name = 'ผักกาด' * 33
+        product.save()
+        cursor = encode_cursor({'name': product.name, 'id': product.pk})
+        url = reverse('product_tab', args=['vegetable'])
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 200)
+            self.assertEqual(self.client.get(url, {'cursor': 'not a cursor'}).status_code, 400)
+
+
+class OrderNumberTests(StoreTransactionTestCase):
+    workers = 8
+
+    def test_allocators_never_hand_out_a_number_twice(self):
+        # One allocator per worker, like separate processes, each drawing
+        # numbers both from its block and one at a time inside transactions
+        def allocate(worker):
+            allocator = BlockAllocator('test_numbers', block_size=20)
+            numbers = []
+            for n in range(250):
+                if n % 5:
+                    numbers.append(allocator.allocate())
+                else:
+                    with transaction.atomic():
+                        numbers.append(allocator.allocate())
+            numbers.extend(allocator.allocate_range(50))
+            return numbers
+
+        results = run_in_threads(allocate, self.workers)
+        numbers = [number for worker_numbers in results for number in worker_numbers]
+        self.assertEqual(len(set(numbers)), self.workers * 300)
+        for worker_numbers in results:
+            self.assertEqual(worker_numbers, sorted(worker_numbers))
+
+    def test_parallel_orders_get_distinct_numbers(self):
+        user = make_user()
+
+        def create_orders(worker):
+            return [Order.objects.create(user=user, total_amount=Decimal('10.00')).order_number for n in range(250)]
+
+        results = run_in_threads(create_orders, self.workers)
+        numbers = [number for worker_numbers in results for number in worker_numbers]
+        self.assertEqual(len(set(numbers)), self.workers * 250)
+        self.assertEqual(Order.objects.values('order_number').distinct().count(), self.workers * 250)
+        prefix = f"ORD{timezone.now():%Y%m%d}"
+        for worker_numbers in results:
+            self.assertEqual(worker_numbers, sorted(worker_numbers))
+            for number in worker_numbers:
+                self.assertRegex(number, rf'^{prefix}\d{{8}}$')
+        self.assertRegex(allocate_order_number(), rf'^{prefix}\d{{8}}$')
+
+
+class StockTests(StoreTransactionTestCase):
+    workers = 8
+
+    def assertSoldExactly(self, option, stock):
+        option.refresh_from_db()
+        ordered = sum(OrderItem.objects.filter(product_option=option).values_list('quantity', flat=True))
+        held = sum(StockReservation.objects.filter(product_option=option).values_list('quantity', flat=True))
+        self.assertGreaterEqual(option.stock_quantity, 0)
+        self.assertEqual(ordered + held + option.stock_quantity, stock)
+        return ordered
+
+    def test_parallel_take_stock_never_oversells(self):
+        option = make_option(stock_quantity=100)
+
+        def take_until_sold_out(worker):
+            taken = 0
+            while True:
+                try:
+                    with transaction.atomic():
+                        take_stock({option.pk: 1})
+                except InsufficientStockError:
+                    return taken
+                taken += 1
+
+        self.assertEqual(sum(run_in_threads(take_until_sold_out, self.workers)), 100)
+        option.refresh_from_db()
+        self.assertEqual(option.stock_quantity, 0)
+
+    def test_parallel_checkouts_sell_exactly_the_stock(self):
+        option = make_option(stock_quantity=40)
+        carts = [Cart.objects.create(user=make_user()) for worker in range(self.workers)]
+
+        def check_out_until_sold_out(worker):
+            cart = carts[worker]
+            sold = 0
+            while True:
+                CartItem.objects.get_or_create(cart=cart, product_option=option)
+                try:
+                    place_order(cart.user, cart)
+                except CheckoutError:
+                    return sold
+                sold += 1
+
+        self.assertEqual(sum(run_in_threads(check_out_until_sold_out, self.workers)), 40)
+        self.assertEqual(self.assertSoldExactly(option, 40), 40)
+        self.assertEqual(option.stock_quantity, 0)
+
+    @override_settings(CART_RESERVATION_SECONDS=60)
+    def test_releasing_expired_holds_during_checkout(self):
+        option = make_option(stock_quantity=30)
+        carts = []
+        for worker in range(self.workers - 2):
+            cart = Cart.objects.create(user=make_user())
+            CartItem.objects.create(cart=cart, product_option=option, quantity=5)
+            cart.mark_changed()
+            carts.append(cart)
+        option.refresh_from_db()
+        self.assertEqual(option.stock_quantity, 0)
+        # Half the carts have held their stock for too long
+        StockReservation.objects.filter(cart__in=carts[::2]).update(expires_at=timezone.now())
+        latecomer = Cart.objects.create(user=make_user())
+
+        def work(worker):
+            if worker < len(carts):
+                try:
+                    place_order(carts[worker].user, carts[worker])
+                except CheckoutError:
+                    pass
+            elif worker == len(carts):
+                for attempt in range(20):
+                    release_expired_reservations()
+            else:
+                # Buys whatever the released holds hand back
+                for attempt in range(20):
+                    CartItem.objects.get_or_create(cart=latecomer, product_option=option)
+                    try:
+                        place_order(latecomer.user, latecomer)
+                    except CheckoutError:
+                        pass
+
+        run_in_threads(work, self.workers)
+        # Holds that had not expired are always honoured
+        for cart in carts[1::2]:
+            self.assertTrue(Order.objects.filter(user=cart.user).exists())
+        self.assertSoldExactly(option, 30)
+        release_expired_reservations()
+        self.assertEqual(StockReservation.objects.count(), 0)
+        self.assertSoldExactly(option, 30)
+
+
+class VersionStampTests(SimpleTestCase):
+
+    def test_file_cache_bumps_are_never_lost(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'ecommerce_project.file_cache.LockingFileBasedCache', 'LOCATION': location,
+        }}):
+            start = get_version('test')
+            run_in_threads(lambda worker: [bump_version('test') for n in range(50)], 8)
+            self.assertEqual(get_version('test'), start + 400)
+
+
+class UpdateCartItemsTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cart = make_cart()
+        self.client.force_login(self.cart.user)
+
+    def post(self, payload):
+        return self.client.post(reverse('update_cart_items'), payload, content_type='application/json')
+
+    def test_malformed_payloads_are_rejected(self):
+        for payload in ({'version': 0, 'changes': 5}, {'version': 0, 'changes': {'op': 'add'}}, {'changes': []}, [1]):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post(payload).status_code, 400)
+
+    def test_batch_is_applied(self):
+        item = self.cart.items.first()
+        response = self.post({'version': self.cart.version, 'changes': [{'op': 'set', 'item_id': item.pk, 'quantity': 5}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['item_count'], 7)
+
+
+class ExportTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.orders = {}
+        for day in (1, 2, 3):
+            order = make_order()
+            created_at = datetime(2024, 1, day, 23, 59)
+            if settings.USE_TZ:
+                created_at = timezone.make_aware(created_at)
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+            self.orders[day] = order.order_number
+
+    def test_date_range_includes_both_ends(self):
+        orders = filter_orders(start=date(2024, 1, 2), end=date(2024, 1, 3))
+        self.assertEqual(set(orders.values_list('order_number', flat=True)), {self.orders[2], self.orders[3]})
+
+    def test_command_writes_through_stdout(self):
+        out = StringIO()
+        call_command('export_orders', start=date(2024, 1, 1), end=date(2024, 1, 1), stdout=out, stderr=StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('order_number,created_at,'))
+        # One row per item
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(line.startswith(self.orders[1]) for line in lines[1:]))
+
+
+@override_settings(READ_REPLICAS=['replica'])
+class ReplicaRoutingTests(StoreTransactionTestCase):
+    # 'replica' mirrors the test database, so rows written here are there too
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+        self.user = make_user()
+        self.client.force_login(self.user)
+
+    def search(self):
+        """Query counts on the primary and the replica for one search request"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('search'), {'q': self.product.name})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [self.product.pk])
+        return [query['sql'] for query in primary], [query['sql'] for query in replica]
+
+    def test_replica_view_reads_products_from_the_replica(self):
+        primary, replica = self.search()
+        self.assertTrue(any('"store_product"' in sql for sql in replica))
+        self.assertFalse(any('"store_product"' in sql and 'store_product_search' not in sql for sql in primary))
+
+    def test_users_and_transactions_stay_on_the_primary(self):
+        @use_replica
+        def view(request):
+            with transaction.atomic():
+                in_transaction = Product.objects.all().db
+            return Product.objects.all().db, User.objects.all().db, in_transaction
+
+        with routing_state():
+            self.assertEqual(view(None), ('replica', 'default', 'default'))
+        # Outside requests everything is read from the primary
+        self.assertEqual(view(None), ('default', 'default', 'default'))
+
+    def test_a_write_pins_later_reads_to_the_primary(self):
+        cart = Cart.objects.create(user=self.user)
+        response = self.client.post(
+            reverse('update_cart_items'), {'version': cart.version, 'changes': []}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        primary, replica = self.search()
+        self.assertEqual(replica, [])
+        self.assertTrue(any('"store_product"' in sql for sql in primary))
+
+
+class FragmentCacheTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.option = make_option()
+        self.product = self.option.product
+
+    def cards(self):
+        return build_product_page('vegetable')['products']
+
+    def render(self):
+        """The card's HTML and how many templates were rendered to produce it"""
+        with mock.patch.object(fragments, 'render_to_string', wraps=fragments.render_to_string) as rendered:
+            html = render_cards(self.cards(), 'en')[0]
+        return html, rendered.call_count
+
+    def test_product_option_and_promotion_changes_rerender_the_card(self):
+        html, renders = self.render()
+        self.assertIn(self.product.name, html)
+        self.assertEqual(self.render(), (html, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed'
+            self.product.save()
+        html, renders = self.render()
+        self.assertIn('Renamed', html)
+        self.assertEqual(renders, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.option.price = Decimal('30.00')
+            self.option.save()
+        self.assertEqual(self.render()[1], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductPromotion.objects.create(product=self.product, promotion=make_promotion(), promotional_price=Decimal('12.00'))
+        html, renders = self.render()
+        self.assertIn('12.00', html)
+        self.assertEqual(renders, 1)
+
+    def test_cards_are_cached_per_language(self):
+        cards = self.cards()
+        with translation.override('th'):
+            thai = render_cards(cards)[0]
+        english = render_cards(cards, 'en')[0]
+        self.assertIn('฿', thai)
+        self.assertNotIn('฿', english)
+        self.assertIn('$', english)
+
+    def test_warmed_tabs_render_without_queries(self):
+        call_command('warm_fragment_cache', languages=['en', 'th'], stdout=StringIO())
+        with mock.patch.object(fragments, 'render_to_string') as rendered, self.assertNumQueries(0):
+            for language in ('en', 'th'):
+                html = render_tab(get_catalog_snapshot()['tabs']['vegetable']['products'], language)
+                self.assertIn(self.product.name, html)
+        rendered.assert_not_called()
+
+
+class OrderQrCodeTests(StoreTestCase):
+
+    def test_concurrent_renders_keep_one_file(self):
+        order = make_order()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            # The payment page and the worker both loaded the order before either rendered
+            page, worker = Order.objects.get(pk=order.pk), Order.objects.get(pk=order.pk)
+            worker.generate_qr_code()
+            page.generate_qr_code()
+
+            stored = Order.objects.get(pk=order.pk).qr_code.name
+            self.assertEqual(page.qr_code.name, stored)
+            self.assertEqual(worker.qr_code.name, stored)
+            self.assertEqual(os.listdir(os.path.join(media_root, 'qr_codes')), [os.path.basename(stored)])
@@ -1,16 +1,23 @@
 ## store/urls.py
 ```python
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Async index, product_detail and cart when served over ASGI
+storefront = async_views if settings.ASYNC_STOREFRONT else views
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('product/<int:product_id>/', views.product_detail, name='product_detail'),
+    path('', storefront.index, name='index'),
+    path('product/<int:product_id>/', storefront.product_detail, name='product_detail'),
+    path('products/<slug:category_type>/', views.product_tab, name='product_tab'),
+    path('search/', views.search, name='search'),
     path('add-to-cart/', views.add_to_cart, name='add_to_cart'),
-    path('cart/', views.cart, name='cart'),
+    path('cart/', storefront.cart, name='cart'),
     path('checkout/', views.checkout, name='checkout'),
     path('process-checkout/', views.process_checkout, name='process_checkout'),
     path('payment/<int:order_id>/', views.payment, name='payment'),
     path('update-cart-item/', views.update_cart_item, name='update_cart_item'),
+    path('update-cart-items/', views.update_cart_items, name='update_cart_items'),
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
 ]
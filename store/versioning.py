@@ -0,0 +1,50 @@
+# store/versioning.py
+# Version stamps kept in the shared cache. Bumping a stamp makes every worker
+# ignore entries cached under the previous version without having to find and
+# delete them.
+import time
+
+from django.core.cache import cache
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    version = cache.get(_key(name))
+    if version is None:
+        # Seed from the clock so a stamp evicted from the cache never falls
+        # back to a value that older entries were cached under.
+        cache.add(_key(name), int(time.time() * 1000), None)
+        version = cache.get(_key(name))
+    return version
+
+
+def get_versions(names):
+    """get_version() for several stamps in one cache round trip: ``{name: version}``"""
+    keys = {_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        seed = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, seed, None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+async def aget_version(name):
+    version = await cache.aget(_key(name))
+    if version is None:
+        await cache.aadd(_key(name), int(time.time() * 1000), None)
+        version = await cache.aget(_key(name))
+    return version
+
+
+def bump_version(name):
+    try:
+        return cache.incr(_key(name))
+    except ValueError:
+        get_version(name)
+        return cache.incr(_key(name))
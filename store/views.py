@@ -3,54 +3,165 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.utils.cache import patch_cache_control
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from django.db.models import Q
 from .models import *
 from accounts.models import UserProfile, PointsHistory
+from .catalog import (
+    get_catalog_snapshot, get_product_page, InvalidCursor,
+    CATEGORY_TYPES, TAB_PAGE_SIZE, MAX_TAB_PAGE_SIZE,
+)
+from .checkout import place_order, CheckoutError, EmptyCartError
+from .carts import get_cart_summary, apply_cart_changes, CartError, StaleCartError
+from .promotions import promotion_index, promotional_price
+from .site_settings import get_site_settings
+from .images import variant_url
+from .routers import use_replica
+from . import search as product_search
 import json
 
-def index(request):
-    carousel_images = CarouselImage.objects.filter(is_active=True)[:5]
-    vegetables = Product.objects.filter(category__category_type='vegetable', is_active=True)
-    fruits = Product.objects.filter(category__category_type='fruit', is_active=True)
-    others = Product.objects.filter(category__category_type='other', is_active=True)
-    
-    # Get active promotions
-    active_promotions = ProductPromotion.objects.filter(
-        promotion__is_active=True,
-        promotion__start_date__lte=timezone.now(),
-        promotion__end_date__gte=timezone.now()
-    )
+# Browsers and proxies may reuse a product tab page for this long
+PRODUCT_TAB_MAX_AGE = 60
+
+def _index_context(request, snapshot):
+    # Carousel and the first page of the active tab come from the cached
+    # snapshot; the other tabs and further pages load from product_tab
+    active_tab = request.GET.get('tab')
+    if active_tab not in CATEGORY_TYPES:
+        active_tab = 'vegetable'
+    page = snapshot['tabs'][active_tab]
+    
+    def tab_products(category_type):
+        return page['products'] if category_type == active_tab else []
     
     context = {
-        'carousel_images': carousel_images,
-        'vegetables': vegetables,
-        'fruits': fruits,
-        'others': others,
-        'active_promotions': active_promotions,
+        'carousel_images': snapshot['carousel'],
+        'vegetables': tab_products('vegetable'),
+        'fruits': tab_products('fruit'),
+        'others': tab_products('other'),
+        'active_tab': active_tab,
+        'next_cursor': page['next_cursor'],
+        'active_promotions': {product['id']: product['promotion'] for product in page['products'] if product['promotion']},
     }
-    return render(request, 'store/index.html', context)
+    return context
 
-def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    options = product.options.all()
+@use_replica
+def index(request):
+    return render(request, 'store/index.html', _index_context(request, get_catalog_snapshot()))
+
+def _product_json(product):
+    promotion = product['promotion']
+    return {
+        'id': product['id'],
+        'name': product['name'],
+        'description': product['description'],
+        'image_url': product['image_url'],
+        'image_webp_url': product['image_webp_url'],
+        'base_price': float(product['base_price']),
+        'points': product['points'],
+        'category': product['category'],
+        'promotion': {'price': float(promotion['price']), 'tag': promotion['tag']} if promotion else None,
+        'options': [
+            {
+                'id': option['id'],
+                'package_type': option['package_type'],
+                'package_label': option['package_label'],
+                'weight': option['weight'],
+                'price': float(option['price']),
+                'promo_price': float(option['promo_price']),
+            }
+            for option in product['options']
+        ],
+    }
+
+@use_replica
+def product_tab(request, category_type):
+    # One keyset page of a product tab: ?cursor=<next_cursor>&limit=<n>
+    if category_type not in CATEGORY_TYPES:
+        raise Http404
     
-    # Check for active promotions
-    promotion = ProductPromotion.objects.filter(
-        product=product,
-        promotion__is_active=True,
-        promotion__start_date__lte=timezone.now(),
-        promotion__end_date__gte=timezone.now()
-    ).first()
+    try:
+        limit = min(max(int(request.GET.get('limit', TAB_PAGE_SIZE)), 1), MAX_TAB_PAGE_SIZE)
+        page = get_product_page(category_type, request.GET.get('cursor') or None, limit)
+    except (ValueError, InvalidCursor):
+        return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
     
-    context = {
+    response = JsonResponse({
+        'success': True,
+        'category_type': category_type,
+        'products': [_product_json(product) for product in page['products']],
+        'next_cursor': page['next_cursor'],
+    })
+    patch_cache_control(response, public=True, max_age=PRODUCT_TAB_MAX_AGE)
+    return response
+
+def _product_detail_context(product, options, promotion):
+    for option in options:
+        option.promo_price = promotional_price(option.price, product.base_price, promotion)
+    
+    return {
         'product': product,
         'options': options,
         'promotion': promotion,
     }
-    return render(request, 'store/product_detail.html', context)
+
+@use_replica
+def product_detail(request, product_id):
+    product = get_object_or_404(Product, id=product_id)
+    options = list(product.options.all())
+    
+    # Check for active promotions
+    promotion = promotion_index.resolve([product.id]).get(product.id)
+    return render(request, 'store/product_detail.html', _product_detail_context(product, options, promotion))
+
+@use_replica
+def search(request):
+    # ?q=<text>[&category=<id>][&limit=<n>]; matches are ranked best first and
+    # facets count matches per category before the category filter
+    query = request.GET.get('q', '')
+    try:
+        category_id = int(request.GET['category']) if request.GET.get('category') else None
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+    
+    result = product_search.search(query, category_id, limit)
+    products = Product.objects.select_related('category').in_bulk([hit.product_id for hit in result.hits])
+    promotions = promotion_index.resolve(list(products))
+    
+    results = []
+    for hit in result.hits:
+        # Deleted since it was indexed, or not on this replica yet
+        product = products.get(hit.product_id)
+        if product is None:
+            continue
+        promotion = promotions.get(product.id)
+        results.append({
+            'id': product.id,
+            'name': product.name,
+            'category': product.category.name,
+            'image_url': variant_url(product.image, 'thumb'),
+            'base_price': float(product.base_price),
+            'price': float(promotion.price if promotion else product.base_price),
+            'promotion_tag': promotion.tag if promotion else None,
+            'url': reverse('product_detail', args=[product.id]),
+            'score': hit.score,
+        })
+    
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'total': result.total,
+        'results': results,
+        'facets': [
+            {'category_id': facet_id, 'category': name, 'count': count}
+            for facet_id, name, count in result.facets
+        ],
+    })
 
 @login_required
 def add_to_cart(request):
@@ -70,45 +181,44 @@ def add_to_cart(request):
         if not created:
             cart_item.quantity += quantity
             cart_item.save()
+        cart.mark_changed()
         
         messages.success(request, 'Item added to cart successfully!')
         return redirect('cart')
 
+def _cart_context(cart, summary):
+    return {
+        'cart_items': summary.items,
+        'total': summary.subtotal,
+        'item_count': summary.item_count,
+        'points_to_earn': summary.points,
+        'cart_version': cart.version,
+    }
+
 @login_required
 def cart(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all()
-    total = sum(item.get_total_price() for item in cart_items)
-    
-    context = {
-        'cart_items': cart_items,
-        'total': total,
-    }
-    return render(request, 'store/cart.html', context)
+    return render(request, 'store/cart.html', _cart_context(cart, get_cart_summary(cart)))
 
 @login_required
 def checkout(request):
     cart = get_object_or_404(Cart, user=request.user)
-    cart_items = cart.items.all()
+    summary = get_cart_summary(cart)
     
-    if not cart_items:
+    if not summary:
         messages.error(request, 'Your cart is empty!')
         return redirect('cart')
     
-    subtotal = sum(item.get_total_price() for item in cart_items)
     user_profile = request.user.userprofile
     available_points = user_profile.points
     
     # Calculate maximum points discount
-    settings = SiteSettings.objects.first()
-    if settings:
-        max_points_discount = available_points * settings.points_to_currency_rate
-    else:
-        max_points_discount = available_points * 0.10  # Default rate
+    max_points_discount = available_points * get_site_settings().points_to_currency_rate
     
     context = {
-        'cart_items': cart_items,
-        'subtotal': subtotal,
+        'cart_items': summary.items,
+        'subtotal': summary.subtotal,
+        'points_to_earn': summary.points,
         'available_points': available_points,
         'max_points_discount': max_points_discount,
     }
@@ -118,71 +228,27 @@ def checkout(request):
 def process_checkout(request):
     if request.method == 'POST':
         cart = get_object_or_404(Cart, user=request.user)
-        cart_items = cart.items.all()
-        
-        if not cart_items:
-            messages.error(request, 'Your cart is empty!')
-            return redirect('cart')
-        
-        subtotal = sum(item.get_total_price() for item in cart_items)
         points_to_use = int(request.POST.get('points_to_use', 0))
         
-        # Calculate points discount
-        settings = SiteSettings.objects.first()
-        points_rate = settings.points_to_currency_rate if settings else 0.10
-        points_discount = min(points_to_use * points_rate, subtotal)
-        
-        total_amount = subtotal - points_discount
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            total_amount=total_amount,
-            points_used=points_to_use,
-            points_discount=points_discount
-        )
-        
-        # Create order items
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product_option=cart_item.product_option,
-                quantity=cart_item.quantity,
-                price=cart_item.product_option.price
-            )
-        
-        # Update user points
-        user_profile = request.user.userprofile
-        if points_to_use > 0:
-            user_profile.points -= points_to_use
-            PointsHistory.objects.create(
-                user=request.user,
-                transaction_type='redeemed',
-                points=points_to_use,
-                description=f'Redeemed for order {order.order_number}'
-            )
-        
-        # Add points for purchase
-        earned_points = sum(item.product_option.product.points * item.quantity for item in cart_items)
-        user_profile.points += earned_points
-        user_profile.save()
-        
-        PointsHistory.objects.create(
-            user=request.user,
-            transaction_type='earned',
-            points=earned_points,
-            description=f'Earned from order {order.order_number}'
-        )
-        
-        # Clear cart
-        cart.items.all().delete()
+        try:
+            order = place_order(request.user, cart, points_to_use)
+        except EmptyCartError as e:
+            messages.error(request, str(e))
+            return redirect('cart')
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('checkout')
         
         return redirect('payment', order_id=order.id)
 
 @login_required
 def payment(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
-    settings = SiteSettings.objects.first()
+    settings = get_site_settings()
+    
+    # The worker normally has the QR ready by now; render it if it hasn't
+    if not order.qr_code:
+        order.generate_qr_code()
     
     context = {
         'order': order,
@@ -198,23 +264,71 @@ def update_cart_item(request):
         quantity = data.get('quantity')
         
         try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
+            cart_item = CartItem.objects.select_related('cart').get(id=item_id, cart__user=request.user)
             cart_item.quantity = quantity
             cart_item.save()
+            cart_item.cart.mark_changed()
             
+            summary = get_cart_summary(cart_item.cart)
+            line = next(item for item in summary.items if item.id == cart_item.id)
             return JsonResponse({
                 'success': True,
-                'new_total': float(cart_item.get_total_price())
+                'new_total': float(line.total_price),
+                'cart_total': float(summary.subtotal),
+                'cart_version': cart_item.cart.version,
             })
         except CartItem.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Item not found'})
     
     return JsonResponse({'success': False, 'error': 'Invalid request'})
 
+@login_required
+def update_cart_items(request):
+    # Applies a whole batch of line changes in one request; see
+    # store.carts.apply_cart_changes for the payload format
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        version = int(data['version'])
+        changes = data.get('changes', [])
+        if not isinstance(changes, list):
+            raise TypeError('changes must be a list')
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+    
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    try:
+        summary = apply_cart_changes(cart, version, changes)
+    except StaleCartError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'cart_version': e.version}, status=409)
+    except CartError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'cart_version': cart.version,
+        'cart_total': float(summary.subtotal),
+        'item_count': summary.item_count,
+        'points_to_earn': summary.points,
+        'items': [
+            {
+                'item_id': item.id,
+                'product_option_id': item.product_option_id,
+                'quantity': item.quantity,
+                'unit_price': float(item.unit_price),
+                'total': float(item.total_price),
+            }
+            for item in summary.items
+        ],
+    })
+
 @login_required
 def remove_from_cart(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    cart_item = get_object_or_404(CartItem.objects.select_related('cart'), id=item_id, cart__user=request.user)
     cart_item.delete()
+    cart_item.cart.mark_changed()
     messages.success(request, 'Item removed from cart!')
     return redirect('cart')
   